@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.admin import ModelAdmin
 
-from account.models import AbstractUser, Group
+from account.models import AbstractUser, Group, OutgoingEmail
 
 
 @admin.action(description="Make user is staff")
@@ -19,3 +19,12 @@ class UserAdmin(admin.ModelAdmin):
 admin.site.register(AbstractUser, UserAdmin)
 
 admin.site.register(Group)
+
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['to', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ('status',)
+    search_fields = ['to']
+
+
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
@@ -0,0 +1,132 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from event.cache import bump
+
+from .models import AbstractUser, Group
+
+# Пользователь (вместе с group) на каждый запрос с JWT берётся из LRU в памяти
+# процесса. Запись живёт AUTH_USER_CACHE_TTL секунд. Сохранение/удаление
+# пользователя увеличивает его собственное поколение в кэше, изменение группы —
+# общее; процессы сверяют общее поколение и поколение записи не чаще, чем раз
+# в CHECK_INTERVAL, так что правка одного профиля не сбрасывает весь LRU.
+GENERATION_KEY = 'auth_users:gen'
+USER_GENERATION_KEY = 'auth_users:gen:{}'
+CHECK_INTERVAL = 1
+
+
+def user_generation(user_id):
+    return cache.get_or_set(USER_GENERATION_KEY.format(user_id), 1, timeout=None)
+
+
+class UserCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = OrderedDict()
+        self.generation = None
+        self.checked_at = 0
+
+    def sync(self):
+        now = time.monotonic()
+        if self.generation is not None and now - self.checked_at < CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+        if generation != self.generation:
+            with self.lock:
+                self.users.clear()
+            self.generation = generation
+
+    def get(self, user_id):
+        self.sync()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.users.get(user_id)
+            if entry is None:
+                return None
+            user, expires_at, generation, checked_at = entry
+            if expires_at < now:
+                del self.users[user_id]
+                return None
+            self.users.move_to_end(user_id)
+        if now - checked_at >= CHECK_INTERVAL:
+            if user_generation(user_id) != generation:
+                with self.lock:
+                    self.users.pop(user_id, None)
+                return None
+            with self.lock:
+                if user_id in self.users:
+                    self.users[user_id] = (user, expires_at, generation, now)
+        # копия на запрос: вью может менять request.user
+        return copy.copy(user)
+
+    def put(self, user_id, user, generation):
+        # generation читается до запроса в БД: правка между чтением и put
+        # не останется незамеченной
+        now = time.monotonic()
+        with self.lock:
+            self.users[user_id] = (user, now + settings.AUTH_USER_CACHE_TTL, generation, now)
+            self.users.move_to_end(user_id)
+            while len(self.users) > settings.AUTH_USER_CACHE_SIZE:
+                self.users.popitem(last=False)
+        return copy.copy(user)
+
+    def invalidate(self, user_id=None):
+        # без user_id — все записи (группы, массовые правки)
+        with self.lock:
+            if user_id is None:
+                self.users.clear()
+            else:
+                self.users.pop(user_id, None)
+        bump(GENERATION_KEY if user_id is None else USER_GENERATION_KEY.format(user_id))
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            generation = user_generation(user_id)
+            try:
+                user = self.user_model.objects.select_related('group').get(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            user = user_cache.put(user_id, user, generation)
+
+        if not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
+
+
+@receiver([post_save, post_delete], sender=AbstractUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver([post_save, post_delete], sender=Group)
+def invalidate_cached_group(sender, instance, **kwargs):
+    user_cache.invalidate()
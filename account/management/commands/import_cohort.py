@@ -0,0 +1,188 @@
+import csv
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from account.models import AbstractUser, Group, UserManager
+from account.outbox import enqueue_many
+from account.tasks import activation_message
+
+COLUMNS = ('email', 'full_name', 'phone_number', 'group', 'course')
+OPTIONAL_COLUMNS = ('direction', 'password', 'user_type')
+
+
+class ExcelSemicolon(csv.excel):
+    # так сохраняет CSV русский Excel
+    delimiter = ';'
+
+
+DIALECTS = {',': csv.excel, ';': ExcelSemicolon, '\t': csv.excel_tab}
+
+
+def sniff_dialect(sample):
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=''.join(DIALECTS))
+    except csv.Error:
+        # Sniffer не справляется с одной колонкой и со строками, где разделителей
+        # разное число: берём тот, которого больше всего в заголовке (или запятую)
+        header = sample.partition('\n')[0]
+        return DIALECTS[max(DIALECTS, key=header.count)]
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        sample = file.read(4096)
+        file.seek(0)
+        # лишние значения в строке DictReader складывает списком под ключ None — их отбрасываем
+        for row in csv.DictReader(file, dialect=sniff_dialect(sample)):
+            yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key is not None}
+
+
+def read_xlsx(path):
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise CommandError('Для .xlsx нужен openpyxl (pip install openpyxl)')
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+    for values in rows:
+        if not any(values):
+            continue
+        yield {key: str(value).strip() if value is not None else '' for key, value in zip(header, values)}
+    workbook.close()
+
+
+def init_worker():
+    # при spawn (macOS/Windows) дочерний процесс стартует без настроенного Django
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = ('Импорт списка студентов из CSV/XLSX: колонки email, full_name, phone_number, group, course '
+            '[, direction, password, user_type]. Уже существующие email/телефоны пропускаются, '
+            'поэтому прерванный импорт можно просто запустить заново. Без password — '
+            'пароль задаётся через «Восстановление пароля».')
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--no-email', action='store_true', help='не отправлять письма активации')
+        parser.add_argument('--dry-run', action='store_true', help='только проверить файл')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows, errors = self.read_rows(options['roster'])
+        for error in errors:
+            self.stderr.write(error)
+        rows = self.skip_existing(rows)
+        self.stdout.write(f'К импорту: {len(rows)}, ошибок в файле: {len(errors)}')
+        if options['dry_run'] or not rows:
+            return
+
+        groups = self.ensure_groups(rows)
+        self.stdout.write(f'Хэширую пароли ({options["workers"]} процессов)...')
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool:
+            hashes = list(pool.map(make_password, [row['password'] or None for row in rows], chunksize=64))
+
+        created = 0
+        batch_size = options['batch_size']
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            users = [
+                AbstractUser(
+                    email=row['email'], full_name=row['full_name'], phone_number=row['phone_number'],
+                    group_id=groups[(row['group'], int(row['course']), row['direction'])],
+                    user_type=row['user_type'], password=password,
+                    activation_code=secrets.token_urlsafe(6), is_active=False,
+                )
+                for row, password in zip(batch, hashes[start:start + batch_size])
+            ]
+            # пользователи и их письма — одной транзакцией на пачку
+            with transaction.atomic():
+                AbstractUser.objects.bulk_create(users)
+                if not options['no_email']:
+                    enqueue_many([(user.email, 'Активация аккаунта', activation_message(user.activation_code))
+                                  for user in users])
+            created += len(users)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{created}/{len(rows)} ({created / elapsed:.0f} в секунду)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {created}, групп: {len(groups)}, за {time.monotonic() - started:.1f} с'
+        ))
+
+    def read_rows(self, path):
+        extension = os.path.splitext(path)[1].lower()
+        if extension == '.csv':
+            reader = read_csv(path)
+        elif extension in ('.xlsx', '.xlsm'):
+            reader = read_xlsx(path)
+        else:
+            raise CommandError('Поддерживаются только .csv и .xlsx')
+
+        rows, errors = [], []
+        seen_emails, seen_phones = set(), set()
+        for number, row in enumerate(reader, start=2):
+            missing = [column for column in COLUMNS if not row.get(column)]
+            if missing:
+                errors.append(f'Строка {number}: нет {", ".join(missing)}')
+                continue
+            row = {column: row.get(column, '') for column in COLUMNS + OPTIONAL_COLUMNS}
+            row['email'] = UserManager.normalize_email(row['email'])
+            row['direction'] = row['direction'] or Group._meta.get_field('direction').default
+            row['user_type'] = row['user_type'] or AbstractUser.UserTypes.STUDENT
+            if row['user_type'] not in AbstractUser.UserTypes.values:
+                errors.append(f'Строка {number}: неизвестный user_type {row["user_type"]}')
+                continue
+            try:
+                int(float(row['course']))
+            except ValueError:
+                errors.append(f'Строка {number}: course должен быть числом')
+                continue
+            row['course'] = str(int(float(row['course'])))
+            if row['email'] in seen_emails or row['phone_number'] in seen_phones:
+                errors.append(f'Строка {number}: {row["email"]} / {row["phone_number"]} уже есть в файле')
+                continue
+            seen_emails.add(row['email'])
+            seen_phones.add(row['phone_number'])
+            rows.append(row)
+        return rows, errors
+
+    def skip_existing(self, rows):
+        emails, phones = set(), set()
+        for start in range(0, len(rows), 500):
+            batch = rows[start:start + 500]
+            emails.update(AbstractUser.objects.filter(email__in=[row['email'] for row in batch])
+                          .values_list('email', flat=True))
+            phones.update(AbstractUser.objects.filter(phone_number__in=[row['phone_number'] for row in batch])
+                          .values_list('phone_number', flat=True))
+        fresh = [row for row in rows if row['email'] not in emails and row['phone_number'] not in phones]
+        if len(fresh) < len(rows):
+            self.stdout.write(f'Уже зарегистрированы, пропущено: {len(rows) - len(fresh)}')
+        return fresh
+
+    def ensure_groups(self, rows):
+        # группа = (name, course, direction); недостающие — одним bulk_create
+        wanted = {(row['group'], int(row['course']), row['direction']) for row in rows}
+        names = {name for name, _, _ in wanted}
+
+        def existing():
+            return {(group.name, group.course, group.direction): group.id
+                    for group in Group.objects.filter(name__in=names)}
+
+        groups = existing()
+        missing = wanted - set(groups)
+        if missing:
+            Group.objects.bulk_create([Group(name=name, course=course, direction=direction)
+                                       for name, course, direction in sorted(missing)])
+            groups = existing()
+            self.stdout.write(f'Создано групп: {len(missing)}')
+        return groups
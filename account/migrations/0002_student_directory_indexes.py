@@ -0,0 +1,31 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='group',
+            name='course',
+            field=models.PositiveSmallIntegerField(db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='group',
+            name='direction',
+            field=models.CharField(db_index=True, default='КОМТЕХНО', max_length=35),
+        ),
+        migrations.AddIndex(
+            model_name='abstractuser',
+            index=models.Index(fields=['user_type', 'id'], name='user_type_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='abstractuser',
+            index=models.Index(fields=['user_type', 'group'], name='user_type_group_idx'),
+        ),
+    ]
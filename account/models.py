@@ -4,6 +4,7 @@ import jwt
 from django.contrib.auth.base_user import BaseUserManager, AbstractBaseUser
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 import secrets
 
@@ -16,7 +17,8 @@ class UserManager(BaseUserManager):
             raise ValidationError('Email cannot be blank')
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.create_activation_code()
+        # код без отдельного save(): пользователь сохраняется один раз ниже
+        user.activation_code = secrets.token_urlsafe(6)
         user.set_password(password)
         user.save(using=self._db)
         return user
@@ -34,8 +36,8 @@ class UserManager(BaseUserManager):
 
 class Group(models.Model):
     name = models.CharField(max_length=35)
-    course = models.PositiveSmallIntegerField()
-    direction = models.CharField(max_length=35, default='КОМТЕХНО')
+    course = models.PositiveSmallIntegerField(db_index=True)
+    direction = models.CharField(max_length=35, default='КОМТЕХНО', db_index=True)
     stage = models.CharField(max_length=35, blank=True, null=True)
 
 
@@ -66,6 +68,13 @@ class AbstractUser(AbstractBaseUser):
     activation_code = models.CharField(max_length=8, blank=True)
     objects = UserManager()
 
+    class Meta:
+        # справочник студентов: фильтр по типу (+ группе) и keyset по id
+        indexes = [
+            models.Index(fields=('user_type', 'id'), name='user_type_id_idx'),
+            models.Index(fields=('user_type', 'group'), name='user_type_group_idx'),
+        ]
+
     def __str__(self):
         return f'{self.full_name} ({self.group if self.group else f"is_staff={self.is_staff}"}) ({self.user_type})'
 
@@ -102,3 +111,30 @@ class AbstractUser(AbstractBaseUser):
 
 
 
+
+
+class OutgoingEmail(models.Model):
+    # исходящие письма пишутся в той же транзакции, что и данные, а уходят
+    # пачками из Celery (account/outbox.py)
+    class Statuses(models.TextChoices):
+        PENDING = 'pending'
+        SENT = 'sent'
+        FAILED = 'failed'
+
+    to = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Statuses.choices, default=Statuses.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=('status', 'next_attempt_at'), name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.to}: {self.subject} ({self.status})'
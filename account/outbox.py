@@ -0,0 +1,122 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from event.cache import acquire_lock, release_lock
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+# повтор через 1, 2, 4 ... минут, но не реже раза в сутки
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(days=1)
+# пачку «занимаем» на это время; если воркер упал, письма уйдут после него
+LEASE = timedelta(minutes=10)
+# outbox выгребает один воркер за раз: на SQLite select_for_update — no-op,
+# и два drain выбрали бы одни и те же письма. Лок продлевается на каждой пачке.
+# Лок живёт в кэше, поэтому разводит воркеры только при общем кэше (redis,
+# см. CACHES); с LocMemCache у каждого процесса свой лок, и два воркера Celery
+# могут отправить одно письмо дважды
+DRAIN_LOCK = 'outbox:drain'
+
+
+def enqueue(to, subject, body):
+    return enqueue_many([(to, subject, body)])[0]
+
+
+def enqueue_many(messages):
+    # messages: [(to, subject, body)]; отправка запускается после коммита,
+    # если транзакция откатится — писем не будет. robust: недоступный брокер
+    # только пишется в лог, письма остаются в outbox до drain_outbox из beat
+    from .tasks import drain_outbox
+    emails = OutgoingEmail.objects.bulk_create(
+        [OutgoingEmail(to=to, subject=subject, body=body) for to, subject, body in messages],
+        batch_size=500,
+    )
+    transaction.on_commit(drain_outbox.delay, robust=True)
+    return emails
+
+
+def claim_batch(batch_size=BATCH_SIZE):
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.Statuses.PENDING, next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=[email.id for email in batch]).update(next_attempt_at=now + LEASE)
+    return batch
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def send_batch(batch):
+    # одно SMTP-соединение на всю пачку
+    sent, failed = [], []
+    try:
+        connection = get_connection()
+        connection.open()
+    except Exception as error:
+        return sent, [(email, error) for email in batch]
+    try:
+        for email in batch:
+            message = EmailMessage(email.subject, email.body, settings.EMAIL_HOST_USER, [email.to],
+                                   connection=connection)
+            try:
+                connection.send_messages([message])
+                sent.append(email)
+            except Exception as error:
+                failed.append((email, error))
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def drain(batch_size=BATCH_SIZE, max_batches=50):
+    # занято — этот же outbox уже выгребает другой воркер
+    token = acquire_lock(DRAIN_LOCK, LEASE.total_seconds())
+    if token is None:
+        return 0
+    try:
+        return drain_locked(token, batch_size, max_batches)
+    finally:
+        release_lock(DRAIN_LOCK, token)
+
+
+def drain_locked(token, batch_size, max_batches):
+    total = 0
+    for _ in range(max_batches):
+        # лок протух и достался другому воркеру — дальше выгребает он
+        if cache.get(DRAIN_LOCK) != token:
+            break
+        cache.touch(DRAIN_LOCK, LEASE.total_seconds())
+        batch = claim_batch(batch_size)
+        if not batch:
+            break
+        sent, failed = send_batch(batch)
+        now = timezone.now()
+        OutgoingEmail.objects.filter(id__in=[email.id for email in sent]).update(
+            status=OutgoingEmail.Statuses.SENT, sent_at=now, last_error='',
+        )
+        for email, error in failed:
+            attempts = email.attempts + 1
+            status = OutgoingEmail.Statuses.FAILED if attempts >= MAX_ATTEMPTS else OutgoingEmail.Statuses.PENDING
+            logger.warning('Письмо #%s для %s не отправлено (попытка %s): %s', email.id, email.to, attempts, error)
+            OutgoingEmail.objects.filter(id=email.id).update(
+                status=status, attempts=attempts, next_attempt_at=now + backoff(attempts), last_error=str(error),
+            )
+        total += len(sent)
+        if len(batch) < batch_size:
+            break
+    return total
@@ -1,5 +1,11 @@
+from urllib.parse import unquote
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from django.urls import reverse
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from event.models import Favorite, Book
 from .models import Group
@@ -7,6 +13,8 @@ from .tasks import send_activation_mail
 
 AbstractUser = get_user_model()
 
+FAVORITES_PREVIEW = 20
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,9 +23,11 @@ class RegisterSerializer(serializers.ModelSerializer):
                   'user_type')
 
     def create(self, validated_data):
-        user = AbstractUser.objects.create_user(**validated_data)
-        user.create_activation_code()
-        send_activation_mail(user.email, user.activation_code)
+        # письмо попадает в outbox в той же транзакции, что и пользователь;
+        # код активации create_user задаёт до первого и единственного save()
+        with transaction.atomic():
+            user = AbstractUser.objects.create_user(**validated_data)
+            send_activation_mail(user.email, user.activation_code)
         return user
 
 
@@ -98,6 +108,7 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
 
 
 class FavoriteListSerializer(serializers.ModelSerializer):
+    # книги — карточками, из context['books'] (см. load_favorite_books)
     class Meta:
         model = Favorite
         fields = ('book',)
@@ -105,19 +116,29 @@ class FavoriteListSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         from event.serializers import BookListSerializer
         rep = super().to_representation(instance)
-        rep['book'] = BookListSerializer(Book.objects.get(id=instance.book_id)).data
+        books = self.context.get('books')
+        book = books.get(instance.book_id) if books is not None else instance.book
+        rep['book'] = BookListSerializer(book, fields=BookListSerializer.CARD_FIELDS).data if book else None
         return rep
 
 
+def load_favorite_books(favorites):
+    # одна выборка книг на всю страницу избранного вместо запросов на каждую
+    from event.serializers import BookListSerializer
+    ids = [favorite.book_id for favorite in favorites]
+    return Book.objects.for_listing(BookListSerializer.CARD_FIELDS).in_bulk(ids)
+
+
 class UserStatsSerializer(serializers.ModelSerializer):
-    books_count = serializers.SerializerMethodField()
+    # поля — аннотации из UserStatsViewSet.get_queryset
+    books_count = serializers.IntegerField(read_only=True)
+    views = serializers.IntegerField(read_only=True)
+    downloads = serializers.IntegerField(read_only=True)
+    favorites_received = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = AbstractUser
-        fields = ('id', 'full_name', 'email', 'phone_number', 'books_count')
-
-    def get_books_count(self, obj):
-        return obj.books.all().count()
+        fields = ('id', 'full_name', 'email', 'phone_number', 'books_count', 'views', 'downloads', 'favorites_received')
 
 
 class UserDetailsSerializer(serializers.ModelSerializer):
@@ -136,10 +157,22 @@ class UserDetailsSerializer(serializers.ModelSerializer):
             rep['group'] = instance.group.name
             rep['course'] = instance.group.course
             rep['direction'] = instance.group.direction
-            rep['fav'] = FavoriteListSerializer(instance.favorites.all(), many=True).data
+            rep['favorites_count'] = instance.favorites.count()
+            rep['links'] = {'favorites': reverse('user-favorites', args=[instance.id])}
+            # ?include=favorites — первая страница избранного прямо в профиле
+            if 'favorites' in self.context.get('include', ()):
+                favorites = list(instance.favorites.order_by('id')[:FAVORITES_PREVIEW])
+                rep['fav'] = FavoriteListSerializer(
+                    favorites, many=True, context={'books': load_favorite_books(favorites)}
+                ).data
         elif instance.user_type == 'teacher':
-            from event.serializers import BookListSerializer
-            rep['user_books'] = BookListSerializer(instance.books.all(), many=True).data
+            # сами книги, их просмотры и комментарии — отдельными постраничными запросами
+            rep['books_summary'] = books_summary(instance)
+            rep['links'] = {
+                'books': reverse('user-books', args=[instance.id]),
+                'book_viewers': book_link('book-viewers'),
+                'book_comments': book_link('book-comments'),
+            }
             rep['is_staff'] = instance.is_staff
 
         rep['phone_number'] = instance.phone_number
@@ -147,6 +180,21 @@ class UserDetailsSerializer(serializers.ModelSerializer):
         return rep
 
 
+def book_link(name):
+    # шаблон ссылки на любую книгу, {book_id} подставляет клиент
+    return unquote(reverse(name, args=['{book_id}']))
+
+
+def books_summary(user):
+    return Book.objects.filter(author_account=user).aggregate(
+        books_count=Count('id'),
+        views=Coalesce(Sum('counters__views'), 0),
+        downloads=Coalesce(Sum('counters__downloads'), 0),
+        favorites=Coalesce(Sum('counters__favorites'), 0),
+        comments=Coalesce(Sum('counters__comments'), 0),
+    )
+
+
 class UserSimpleSerializer(serializers.ModelSerializer):
     class Meta:
         model = AbstractUser
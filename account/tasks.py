@@ -1,10 +1,13 @@
 from celery import shared_task
 from django.conf import settings
-from django.core.mail import send_mail
 
+from .outbox import drain, enqueue
 
-@shared_task
-def send_activation_mail(email, activation_code):
+# письма не отправляются отсюда напрямую: они пишутся в outbox (OutgoingEmail)
+# и уходят пачками из drain_outbox по одному SMTP-соединению
+
+
+def activation_message(activation_code):
     activation_url = f'{settings.DOMAIN}/api/v1/accounts/activate/{activation_code}'
     message = f"""
         Урматтуу пользователь!
@@ -40,12 +43,11 @@ def send_activation_mail(email, activation_code):
 - и мн. другое.
 Ваши комментарии по сайту нам интересны для улучшения работы сайта, поэтому можете написать сообщение по адресу intuitkg@mail.ru с указанием «для Научно-информационной библиотеки».
 """
-    send_mail(
-        subject='Активация аккаунта',
-        message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=(email, )
-    )
+    return message
+
+
+def send_activation_mail(email, activation_code):
+    enqueue(email, 'Активация аккаунта', activation_message(activation_code))
 
 
 @shared_task
@@ -54,11 +56,11 @@ def send_reset_email(email):
     user = AbstractUser.objects.get(email=email)
     user.create_activation_code()
     message = f"Код для восстановления пароля {user.activation_code}"
-    send_mail(
-        subject='Восстановление пароля',
-        message=message,
-        from_email=settings.EMAIL_HOST_USER,
-        recipient_list=(email, )
-    )
+    enqueue(email, 'Восстановление пароля', message)
+
+
+@shared_task
+def drain_outbox():
+    return drain()
 
 # celery
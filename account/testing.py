@@ -0,0 +1,12 @@
+from .models import AbstractUser
+
+PASSWORD = 'password123'
+
+
+def make_user(email, user_type='student', **fields):
+    # активный пользователь для тестов; email служит и телефоном, и именем
+    user = AbstractUser(email=email, phone_number=email, full_name=email, user_type=user_type,
+                        is_active=True, **fields)
+    user.set_password(PASSWORD)
+    user.save()
+    return user
@@ -1,3 +1,413 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.mail.backends import locmem
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from event.models import Book, BookDirection, Comment, Favorite, ViewsStats
+from event.serializers import BookListSerializer
+from . import authentication, outbox
+from .models import AbstractUser, Group, OutgoingEmail
+from .outbox import enqueue_many
+from .serializers import FavoriteListSerializer, load_favorite_books
+from .testing import make_user
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class AccountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # LRU живёт в модуле, а id после отката транзакции повторяются
+        authentication.user_cache.invalidate()
+        self.client = APIClient()
+        self.group = Group.objects.create(name='ИТ-1', course=1)
+
+
+class UserStatsPaginationTest(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        direction = BookDirection.objects.create(name='ИТ')
+        # много преподавателей с одинаковым числом книг — страницы режут серии равных значений
+        self.teachers = [make_user(f't{i}@example.com', user_type='teacher', is_staff=True) for i in range(11)]
+        for i, teacher in enumerate(self.teachers):
+            Book.objects.bulk_create([Book(title=f'Книга {i}.{k}', author='Автор', description='Описание',
+                                           direction=direction, pdf=f'books/{i}-{k}.pdf', author_account=teacher)
+                                      for k in range(i % 3)])
+        self.client.force_authenticate(self.teachers[0])
+
+    def walk(self, url):
+        ids, pages = [], []
+        while url:
+            data = self.client.get(url).data
+            ids += [row['id'] for row in data['results']]
+            pages.append(data)
+            url = data['next']
+        return ids, pages
+
+    def test_pages_cover_ties_once(self):
+        for ordering in ('-books_count', 'books_count', 'id'):
+            expected = [row['id'] for row in self.client.get(f'/api/v1/accounts/stats/?ordering={ordering}').data]
+            ids, pages = self.walk(f'/api/v1/accounts/stats/?ordering={ordering}&limit=3')
+            self.assertEqual(ids, expected, ordering)
+
+            # обратно по previous — те же страницы
+            backward, url = [], pages[-1]['previous']
+            while url:
+                data = self.client.get(url).data
+                backward = [row['id'] for row in data['results']] + backward
+                url = data['previous']
+            self.assertEqual(backward, expected[:len(backward)])
+            self.assertEqual(len(backward), len(expected) - len(pages[-1]['results']))
+
+    def test_cursor_has_no_offset(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/v1/accounts/stats/?ordering=-books_count&limit=3').data
+        with self.assertNumQueries(1) as context:
+            self.client.get(data['next'])
+        self.assertNotIn('OFFSET', context.captured_queries[0]['sql'])
+
+    def test_tampered_cursor(self):
+        paginator = CursorPagination()
+        paginator.base_url = 'http://testserver/api/v1/accounts/stats/?ordering=-books_count'
+        for position in ['abc', '1', '[1]', '[1, 2, 3]', '[1, "x"]', '[null, 1]', '[[1], 1]', '["x", 1]']:
+            url = paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+            self.assertEqual(self.client.get(url).status_code, 404, position)
+        self.assertEqual(self.client.get('/api/v1/accounts/stats/?cursor=garbage').status_code, 404)
+
+
+
+class LibraryTestCase(AccountTestCase):
+    # преподаватель с пятью книгами, у каждой — просмотр, комментарий и избранное студента
+    def setUp(self):
+        super().setUp()
+        direction = BookDirection.objects.create(name='ИТ')
+        self.teacher = make_user('teacher@example.com', user_type='teacher', is_staff=True)
+        self.student = make_user('student@example.com', group=self.group)
+        self.books = [Book.objects.create(title=f'Книга {i}', author='Автор', description='Описание',
+                                          direction=direction, pdf=f'books/{i}.pdf', author_account=self.teacher)
+                      for i in range(5)]
+        for book in self.books:
+            ViewsStats.objects.create(user=self.student, book=book, v_count=True)
+            Comment.objects.create(user=self.student, book=book, text='Комментарий')
+            Favorite.objects.create(user=self.student, book=book)
+
+
+class ProfileTest(LibraryTestCase):
+    def profile(self, user, url='/api/v1/accounts/profile/'):
+        self.client.force_authenticate(user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_teacher_profile_has_summary_and_links(self):
+        data = self.profile(self.teacher)
+        self.assertNotIn('books', data)
+        self.assertEqual(data['books_summary'], {'books_count': 5, 'views': 5, 'downloads': 0,
+                                                 'favorites': 5, 'comments': 5})
+        links = data['links']
+        self.assertEqual(links['books'], f'/api/v1/accounts/{self.teacher.id}/books/')
+        book = self.books[0]
+        viewers = self.client.get(links['book_viewers'].format(book_id=book.id)).data['results']
+        self.assertEqual([row['user']['id'] for row in viewers], [self.student.id])
+        comments = self.client.get(links['book_comments'].format(book_id=book.id)).data['results']
+        self.assertEqual([row['text'] for row in comments], ['Комментарий'])
+
+    def test_teacher_books_are_paginated(self):
+        url = f'/api/v1/accounts/{self.teacher.id}/books/?limit=2'
+        ids = []
+        while url:
+            with self.assertNumQueries(2):
+                data = self.client.get(url).data
+            ids += [book['id'] for book in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [book.id for book in self.books])
+
+    def test_student_profile(self):
+        data = self.profile(self.student)
+        self.assertEqual(data['favorites_count'], 5)
+        self.assertNotIn('fav', data)
+        self.assertEqual(data['links']['favorites'], f'/api/v1/accounts/{self.student.id}/favorites/')
+        data = self.profile(self.student, '/api/v1/accounts/profile/?include=favorites')
+        self.assertEqual(len(data['fav']), 5)
+
+
+class FavoritesTest(LibraryTestCase):
+    def walk(self, url, queries):
+        ids = []
+        while url:
+            with self.assertNumQueries(queries):
+                data = self.client.get(url).data
+            ids += [row['book']['id'] for row in data['results']]
+            url = data['next']
+        return ids, data['results'][-1]['book']
+
+    def test_pages_are_batch_loaded_cards(self):
+        # пользователь, страница избранного, книги одной выборкой
+        ids, card = self.walk(f'/api/v1/accounts/{self.student.id}/favorites/?limit=2', 3)
+        self.assertEqual(ids, [book.id for book in self.books])
+        self.assertEqual(set(card), set(BookListSerializer.CARD_FIELDS))
+
+        direction = self.books[0].direction
+        for i in range(10):
+            book = Book.objects.create(title=f'Ещё {i}', author='Автор', description='Описание',
+                                       direction=direction, pdf=f'books/more-{i}.pdf', author_account=self.teacher)
+            Favorite.objects.create(user=self.student, book=book)
+        self.assertEqual(len(self.walk(f'/api/v1/accounts/{self.student.id}/favorites/?limit=20', 3)[0]), 15)
+
+    def test_deleted_book_is_skipped(self):
+        # книгу удалили, пока страница избранного уже была выбрана
+        favorites = list(Favorite.objects.filter(user=self.student).order_by('id'))
+        Book.objects.filter(id=self.books[0].id).delete()
+        data = FavoriteListSerializer(favorites, many=True, context={'books': load_favorite_books(favorites)}).data
+        self.assertIsNone(data[0]['book'])
+        self.assertEqual([row['book']['id'] for row in data if row['book']], [book.id for book in self.books[1:]])
+
+
+class StudentListTest(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.second = Group.objects.create(name='ЭК-2', course=2, direction='ЭКОНОМ')
+        self.first_course = [make_user(f'a{i}@example.com', group=self.group) for i in range(3)]
+        self.second_course = [make_user(f'b{i}@example.com', group=self.second) for i in range(2)]
+        make_user('teacher@example.com', user_type='teacher', is_staff=True)
+
+    def ids(self, url, queries=1):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data]
+
+    def test_one_query_with_groups(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/v1/accounts/list/').data
+        self.assertEqual(len(data), 5)
+        self.assertEqual((data[-1]['group'], data[-1]['course'], data[-1]['direction']), ('ЭК-2', 2, 'ЭКОНОМ'))
+
+    def test_filters(self):
+        first = [user.id for user in self.first_course]
+        second = [user.id for user in self.second_course]
+        self.assertEqual(sorted(self.ids(f'/api/v1/accounts/list/?group={self.group.id}')), first)
+        self.assertEqual(sorted(self.ids('/api/v1/accounts/list/?course=2')), second)
+        self.assertEqual(sorted(self.ids('/api/v1/accounts/list/?direction=ЭКОНОМ&course=2')), second)
+        self.assertEqual(self.ids('/api/v1/accounts/list/?direction=ЭКОНОМ&course=1'), [])
+        self.assertEqual(self.client.get('/api/v1/accounts/list/?group=abc').status_code, 400)
+
+    def test_pages(self):
+        url, ids = '/api/v1/accounts/list/?limit=2', []
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).data
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, sorted(user.id for user in self.first_course + self.second_course))
+
+    def test_stream(self):
+        response = self.client.get('/api/v1/accounts/list/?stream=jsonl&course=1')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        with self.assertNumQueries(1):
+            lines = b''.join(response.streaming_content).decode().splitlines()
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['id'] for row in rows], [user.id for user in self.first_course])
+        self.assertEqual(rows[0]['group'], 'ИТ-1')
+
+
+class CachedUserTest(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        self.first = make_user('a@example.com', group=self.group)
+        self.second = make_user('b@example.com', group=self.group)
+        # второй процесс: своя память, общий кэш
+        self.other = authentication.UserCache()
+        self.other.get(0)
+        for user in (self.first, self.second):
+            self.other.put(user.pk, user, authentication.user_generation(user.pk))
+
+    def later(self, seconds):
+        now = time.monotonic() + seconds
+        return mock.patch.object(authentication.time, 'monotonic', lambda: now)
+
+    def test_save_drops_only_that_user(self):
+        self.first.full_name = 'Новое имя'
+        self.first.save()
+        with self.later(authentication.CHECK_INTERVAL + 1):
+            self.assertIsNone(self.other.get(self.first.pk))
+            self.assertEqual(self.other.get(self.second.pk).pk, self.second.pk)
+
+    def test_group_save_drops_everyone(self):
+        self.group.save()
+        with self.later(authentication.CHECK_INTERVAL + 1):
+            self.assertIsNone(self.other.get(self.second.pk))
+
+    def test_request_sees_saved_profile(self):
+        token = RefreshToken.for_user(self.first).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/api/v1/accounts/profile/').status_code, 200)
+        self.first.is_active = False
+        self.first.save()
+        self.assertEqual(self.client.get('/api/v1/accounts/profile/').status_code, 401)
+
+    def test_cached_user_skips_lookup(self):
+        teacher = make_user('teacher@example.com', user_type='teacher', is_staff=True)
+        token = RefreshToken.for_user(teacher).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/v1/books/1/add_view/').status_code, 204)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/v1/books/1/add_view/').status_code, 204)
+
+    @override_settings(AUTH_USER_CACHE_SIZE=1)
+    def test_least_recently_used_is_evicted(self):
+        users = authentication.UserCache()
+        users.get(0)
+        for user in (self.first, self.second):
+            users.put(user.pk, user, authentication.user_generation(user.pk))
+        self.assertIsNone(users.get(self.first.pk))
+        self.assertEqual(users.get(self.second.pk).pk, self.second.pk)
+
+
+class RegistrationTest(AccountTestCase):
+    def test_one_save_and_one_mail_with_stored_code(self):
+        saves = mock.Mock()
+        post_save.connect(saves, sender=AbstractUser)
+        self.addCleanup(post_save.disconnect, saves, sender=AbstractUser)
+        with mock.patch('account.tasks.drain_outbox.delay') as delay, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/accounts/register/', {
+                'email': 'new@example.com', 'full_name': 'Новый Студент', 'password': 'password123',
+                'phone_number': '+996700000000', 'user_type': 'student',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(saves.call_count, 1)
+        delay.assert_called_once()
+        user = AbstractUser.objects.get(email='new@example.com')
+        self.assertTrue(user.activation_code)
+        self.assertFalse(user.is_active)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, 'new@example.com')
+        self.assertIn(f'/api/v1/accounts/activate/{user.activation_code}', email.body)
+
+
+class OutboxTest(AccountTestCase):
+    def setUp(self):
+        super().setUp()
+        with mock.patch('account.tasks.drain_outbox.delay'), self.captureOnCommitCallbacks(execute=True):
+            self.emails = enqueue_many([(f'user{i}@example.com', 'Тема', 'Текст') for i in range(3)])
+
+    def statuses(self):
+        return list(OutgoingEmail.objects.order_by('id').values_list('status', 'attempts'))
+
+    def test_drain_sends_in_batches(self):
+        self.assertEqual(outbox.drain(batch_size=2), 3)
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['user0@example.com'], ['user1@example.com'], ['user2@example.com']])
+        self.assertEqual(self.statuses(), [('sent', 0)] * 3)
+        self.assertIsNone(cache.get(outbox.DRAIN_LOCK))
+        self.assertEqual(outbox.drain(), 0)
+
+    def test_failures_back_off(self):
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('smtp down')), \
+                self.assertLogs('account.outbox', 'WARNING'):
+            self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(self.statuses(), [('pending', 1)] * 3)
+        # до следующей попытки письма не берутся
+        self.assertEqual(outbox.drain(), 0)
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now(), attempts=outbox.MAX_ATTEMPTS - 1)
+        with mock.patch.object(locmem.EmailBackend, 'send_messages', side_effect=OSError('smtp down')), \
+                self.assertLogs('account.outbox', 'WARNING'):
+            outbox.drain()
+        self.assertEqual(self.statuses(), [('failed', outbox.MAX_ATTEMPTS)] * 3)
+        self.assertEqual(outbox.backoff(1), outbox.BACKOFF_BASE)
+        self.assertEqual(outbox.backoff(30), outbox.BACKOFF_MAX)
+
+    def test_busy_lock(self):
+        cache.set(outbox.DRAIN_LOCK, 'other')
+        self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(cache.get(outbox.DRAIN_LOCK), 'other')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_lost_lock_is_not_released(self):
+        # лок протух посреди пачки, его взял другой воркер: мы останавливаемся
+        # и его лок не снимаем
+        send_batch = outbox.send_batch
+
+        def slow_send(batch):
+            cache.set(outbox.DRAIN_LOCK, 'other')
+            return send_batch(batch)
+
+        with mock.patch('account.outbox.send_batch', side_effect=slow_send):
+            self.assertEqual(outbox.drain(batch_size=2), 2)
+        self.assertEqual(cache.get(outbox.DRAIN_LOCK), 'other')
+        self.assertEqual(self.statuses(), [('sent', 0), ('sent', 0), ('pending', 0)])
+
+
+class ImportCohortTest(AccountTestCase):
+    HEADER = ['email', 'full_name', 'phone_number', 'group', 'course', 'direction']
+
+    def roster(self, lines, delimiter=','):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'roster.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            file.write(''.join(delimiter.join(line) + '\r\n' for line in lines))
+        return path
+
+    def run_import(self, path, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch('account.tasks.drain_outbox.delay'):
+            call_command('import_cohort', path, '--workers=1', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_semicolon_roster(self):
+        make_user('old@example.com')
+        path = self.roster([
+            self.HEADER,
+            ['New@Example.com', 'Новый Студент', '+996700000001', 'ИТ-1', '1', ''],
+            ['second@example.com', 'Второй Студент', '+996700000002', 'ЭК-2', '2.0', 'ЭКОНОМ'],
+            ['old@example.com', 'Уже есть', '+996700000003', 'ИТ-1', '1', ''],
+            ['bad@example.com', 'Без курса', '+996700000004', 'ИТ-1', '', ''],
+        ], delimiter=';')
+        stdout, stderr = self.run_import(path, '--dry-run')
+        self.assertIn('К импорту: 2', stdout)
+        self.assertIn('Строка 5: нет course', stderr)
+        self.assertFalse(AbstractUser.objects.filter(email='second@example.com').exists())
+
+        self.run_import(path)
+        new = AbstractUser.objects.select_related('group').get(email='New@example.com')
+        self.assertEqual((new.group_id, new.is_active), (self.group.id, False))
+        # без password — вход только после «Восстановления пароля»
+        self.assertTrue(new.activation_code)
+        self.assertFalse(new.has_usable_password())
+        second = AbstractUser.objects.select_related('group').get(email='second@example.com')
+        self.assertEqual((second.group.name, second.group.course, second.group.direction), ('ЭК-2', 2, 'ЭКОНОМ'))
+        self.assertEqual(sorted(OutgoingEmail.objects.values_list('to', flat=True)),
+                         ['New@example.com', 'second@example.com'])
+        # повторный запуск ничего не создаёт
+        self.assertIn('К импорту: 0', self.run_import(path)[0])
+
+    def test_rosters_the_sniffer_cannot_read(self):
+        # одна колонка: Sniffer не находит разделитель — файл читается, строки отбраковываются
+        stdout, stderr = self.run_import(self.roster([['email'], ['a@example.com'], ['b@example.com']]))
+        self.assertIn('К импорту: 0, ошибок в файле: 2', stdout)
+        self.assertIn('Строка 2: нет full_name, phone_number, group, course', stderr)
+
+        # разное число разделителей в строках — разделитель берётся из заголовка
+        path = self.roster([
+            self.HEADER,
+            ['a@example.com', 'Студент', '+996700000001', 'ИТ-1', '1', '', 'лишнее', 'ещё'],
+        ], delimiter=';')
+        self.assertIn('К импорту: 1', self.run_import(path, '--no-email')[0])
+        self.assertTrue(AbstractUser.objects.filter(email='a@example.com').exists())
+        self.assertFalse(OutgoingEmail.objects.exists())
 
-# Create your tests here
\ No newline at end of file
@@ -12,6 +12,8 @@ urlpatterns = [
     path('reset_password_complete/', views.ResetPasswordCompleteView.as_view()),
     path('change_password/', views.ChangePasswordView.as_view()),
     path('info/<int:id>/', views.UserInfoView.as_view()),
+    path('<int:id>/books/', views.UserBooksView.as_view(), name='user-books'),
+    path('<int:id>/favorites/', views.UserFavoritesView.as_view(), name='user-favorites'),
     path('groups/', views.GroupListView.as_view()),
     path('stats/', views.UserStatsViewSet.as_view({'get': 'list'})),
     path('list/', views.UserList.as_view())
@@ -1,4 +1,6 @@
-from rest_framework import status, viewsets
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import mixins, status, viewsets
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -7,7 +9,8 @@ from rest_framework.views import APIView
 from . import serializers
 from .serializers import RegisterSerializer, ForgotPasswordSerializer, \
     CreateNewPasswordSerializer, ChangePasswordSerializer, LoginSerializer, \
-    UserDetailsSerializer, UserStatsSerializer, UserSimpleSerializer
+    UserDetailsSerializer, UserStatsSerializer, UserSimpleSerializer, FavoriteListSerializer, \
+    load_favorite_books
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from drf_yasg.utils import swagger_auto_schema
@@ -16,6 +19,10 @@ from django.shortcuts import get_object_or_404, redirect
 from .models import AbstractUser as User
 from .models import Group
 from .tasks import send_reset_email
+from event.models import Book, Favorite
+from event.paginator import KeysetPagination, SortableKeysetPagination, paginated_response
+from event.serializers import BookListSerializer
+from event.streaming import streaming_json_lines_response
 from django.conf import settings
 
 
@@ -78,7 +85,7 @@ class DetailsUserView(APIView):
         if email is None:
             email = request.user.email
         user = get_object_or_404(User, email=email)
-        return Response(UserDetailsSerializer(user).data)
+        return Response(UserDetailsSerializer(user, context=profile_context(request)).data)
 
     def put(self, request, email=None):
         if email is None:
@@ -98,17 +105,81 @@ class UserInfoView(APIView):
     def get(self, request, id):
         user_id = self.kwargs.get('id')
         user = get_object_or_404(User, id=user_id)
-        return Response(UserDetailsSerializer(user).data)
+        return Response(UserDetailsSerializer(user, context=profile_context(request)).data)
 
 
-class UserList(APIView):
+def profile_context(request):
+    include = request.query_params.get('include', '')
+    return {'include': [name.strip() for name in include.split(',') if name.strip()]}
+
+
+class UserFavoritesView(APIView):
+    # избранное карточками, постранично: ?cursor=&limit=
+    def get(self, request, id):
+        user = get_object_or_404(User, id=id)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(Favorite.objects.filter(user=user), request, view=self)
+        serializer = FavoriteListSerializer(page, many=True, context={'books': load_favorite_books(page)})
+        return paginator.get_paginated_response(serializer.data)
 
-    def get(self, reques):
-        return Response(UserSimpleSerializer(User.objects.filter(user_type='student'), many=True).data)
 
-class UserStatsViewSet(viewsets.ModelViewSet):
-    queryset = User.objects.filter(is_staff=True)
+class UserBooksView(APIView):
+    # книги преподавателя карточками, постранично: ?cursor=&limit=[&fields=]
+    def get(self, request, id):
+        user = get_object_or_404(User, id=id)
+        fields = request.query_params.get('fields')
+        fields = [name.strip() for name in fields.split(',') if name.strip()] if fields \
+            else BookListSerializer.CARD_FIELDS
+        queryset = Book.objects.filter(author_account=user).for_listing(fields)
+        return paginated_response(request, self, queryset, BookListSerializer, fields=fields)
+
+
+class UserList(APIView):
+    # ?group=&course=&direction= — фильтры; ?cursor=&limit= — постранично;
+    # ?stream=jsonl — весь список JSON Lines потоком, без сборки в памяти
+    def get(self, request):
+        queryset = User.objects.filter(user_type='student').select_related('group')
+        filters = {}
+        try:
+            if request.query_params.get('group'):
+                filters['group_id'] = int(request.query_params['group'])
+            if request.query_params.get('course'):
+                filters['group__course'] = int(request.query_params['course'])
+        except ValueError:
+            return Response({'error': 'group и course должны быть числами'}, status=400)
+        if request.query_params.get('direction'):
+            filters['group__direction'] = request.query_params['direction']
+        queryset = queryset.filter(**filters)
+
+        if request.query_params.get('stream') == 'jsonl':
+            return streaming_json_lines_response(queryset.order_by('id'), lambda user: UserSimpleSerializer(user).data)
+        if KeysetPagination.is_requested(request):
+            return paginated_response(request, self, queryset, UserSimpleSerializer)
+        return Response(UserSimpleSerializer(queryset, many=True).data)
+
+class UserStatsViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    # рейтинг преподавателей одним запросом: счётчики книг берутся из BookCounters
     serializer_class = UserStatsSerializer
+    ordering_fields = ('books_count', 'views', 'downloads', 'favorites_received', 'id')
+    ordering = '-books_count'
+
+    def get_queryset(self):
+        return User.objects.filter(is_staff=True).annotate(
+            books_count=Count('books'),
+            views=Coalesce(Sum('books__counters__views'), 0),
+            downloads=Coalesce(Sum('books__counters__downloads'), 0),
+            favorites_received=Coalesce(Sum('books__counters__favorites'), 0),
+        )
+
+    def list(self, request, *args, **kwargs):
+        paginator = SortableKeysetPagination()
+        queryset = self.get_queryset()
+        # без ?cursor/?limit — весь список, как раньше, но тоже одним запросом
+        if KeysetPagination.is_requested(request):
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+        queryset = queryset.order_by(*paginator.get_ordering(request, queryset, self))
+        return Response(self.get_serializer(queryset, many=True).data)
 
 class GroupListView(ListAPIView):
     queryset = Group.objects.all()
@@ -10,11 +10,11 @@ app.conf.timezone = TIME_ZONE
 
 app.autodiscover_tasks()
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-from datetime import timedelta
 app.conf.beat_schedule = {
-    'check_event_dates': {
-        'task': 'event.tasks.check_event_dates',
-        'schedule': timedelta(days=1),
+    # повторные попытки писем из outbox (account/outbox.py)
+    'drain-outbox': {
+        'task': 'account.tasks.drain_outbox',
+        'schedule': 60,
     },
 }
 # python -m celery -A config worker -l info
\ No newline at end of file
@@ -137,26 +137,50 @@ STATIC_ROOT = os.path.join(BASE_DIR, '/var/www/html/lstatic/')
 MEDIA_ROOT = os.path.join(BASE_DIR, '/var/www/html/lmedia/')
 MEDIA_URL = '/var/www/html/lmedia/'
 
-DATA_UPLOAD_MAX_MEMORY_SIZE = 2097152000
-FILE_UPLOAD_MAX_MEMORY_SIZE = 2097152000
+# '' — PDF отдаёт Django (FileResponse/sendfile), 'X-Accel-Redirect' (nginx)
+# или 'X-Sendfile' (apache) — отдаёт фронтовой прокси
+PDF_SENDFILE_HEADER = config('PDF_SENDFILE_HEADER', default='')
+PDF_ACCEL_PREFIX = config('PDF_ACCEL_PREFIX', default='/protected/lmedia/')
+
+# файлы больше FILE_UPLOAD_MAX_MEMORY_SIZE пишутся во временный файл, а не в память;
+# большие PDF грузятся кусками через /api/v1/books/uploads/
+DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
+
+UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'uploads/tmp')
+UPLOAD_MAX_SIZE = 2097152000
+UPLOAD_CHUNK_SIZE = 5242880
+UPLOAD_MAX_CHUNK_SIZE = 16777216
+UPLOAD_SESSION_TTL = timedelta(days=2)
+
+# буфер просмотров/скачиваний (event/counters.py); 0 — писать сразу
+STATS_FLUSH_INTERVAL = config('STATS_FLUSH_INTERVAL', default=5, cast=int)
+STATS_FLUSH_SIZE = 500
 
 REST_FRAMEWORK = {
     # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     # 'PAGE_SIZE': 6,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ),
-    'DATA_UPLOAD_MAX_MEMORY_SIZE': 2097152000,
-    'FILE_UPLOAD_MAX_MEMORY_SIZE': 2097152000,
-
 }
 
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
+# общий для всех воркеров кэш (redis) — иначе инвалидация по сигналам
+# видна только в том процессе, где произошла запись, а замки на cache.add
+# (outbox, пересчёт статистики) работают только внутри одного процесса
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 CSRF_TRUSTED_ORIGINS = ['https://texxtrend.com',
@@ -165,6 +189,10 @@ CSRF_TRUSTED_ORIGINS = ['https://texxtrend.com',
                         'http://localhost:3000']
 
 
+# account/authentication.py: LRU пользователей в памяти процесса
+AUTH_USER_CACHE_TTL = 60
+AUTH_USER_CACHE_SIZE = 1024
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -4,20 +4,22 @@ from django.conf.urls.static import static
 from django.conf import settings
 from rest_framework.routers import DefaultRouter
 
-from event.views import BookViewSet, NewsViewSet, DirectionStatsViewSet
+from event.views import BookViewSet, NewsViewSet, DirectionStatsViewSet, CacheStatsView
 
 router = DefaultRouter()
 router.register('', BookViewSet)
 
 news = DefaultRouter()
-news.register('', NewsViewSet)
+news.register('', NewsViewSet, basename='news')
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/accounts/', include('account.urls')),
     path('api/v1/books/', include(router.urls)),
-    path('api/v1/news/', include(router.urls)),
+    path('api/v1/news/', include(news.urls)),
     path('api/v1/stats/', DirectionStatsViewSet.as_view({'get': 'list'}), name='stats'),
+    path('api/v1/stats/genres/', DirectionStatsViewSet.as_view({'get': 'genres'}), name='genre-stats'),
+    path('api/v1/stats/cache/', CacheStatsView.as_view(), name='cache-stats'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+
+from .duplicates import exact_clusters, near_clusters, delete_duplicates
 from .models import *
 
 admin.site.register(Favorite)
@@ -9,9 +13,9 @@ admin.site.register(News)
 
 @admin.action(description="Delete copies")
 def delete_cp(self, request, queryset):
-     books = Book.objects.filter(title__in=Book.objects.values_list('title', flat=True).distinct())
-     books.delete()
-     books.save()
+    # среди выбранных книг: одинаковые название+автор или PDF, остаётся самая старая
+    deleted = delete_duplicates(exact_clusters(queryset))
+    self.message_user(request, f'Удалено копий: {deleted}')
 
 @admin.action(description="Danoni All")
 def danoni(self, request, queryset):
@@ -24,6 +28,24 @@ class BookAdmin(admin.ModelAdmin):
     list_filter = ('author_account',)
     actions = [delete_cp, danoni]
 
+    def get_urls(self):
+        return [
+            path('duplicates/', self.admin_site.admin_view(self.duplicates_view), name='event_book_duplicates'),
+        ] + super().get_urls()
+
+    def duplicates_view(self, request):
+        def load(clusters):
+            books = Book.objects.only('id', 'title', 'author').in_bulk([pk for cluster in clusters for pk in cluster])
+            return [[books[pk] for pk in cluster if pk in books] for cluster in clusters]
+
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Дубликаты книг',
+            exact=load(exact_clusters()),
+            near=load(near_clusters()),
+        )
+        return TemplateResponse(request, 'admin/event/book/duplicates.html', context)
+
 
 admin.site.register(Book, BookAdmin)
 
@@ -0,0 +1,61 @@
+import time
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+from .cache import KEY_PREFIX, acquire_lock, generation, release_lock
+from .models import BookDirection, Genre
+from .serializers import DirectionStatsSerializer, GenreStatsSerializer
+
+# Страница «Статистика»: по направлениям и жанрам — книги, просмотры, скачивания,
+# избранное; один GROUP BY по books + BookCounters на каждую таблицу.
+# Результат лежит в кэше без TTL. Когда поколение 'stats' меняется, его
+# пересчитывает один процесс и не чаще раза в REFRESH_INTERVAL секунд,
+# остальные тем временем отдают прошлый результат.
+REFRESH_INTERVAL = 30
+
+
+def grouped(model):
+    return model.objects.order_by('id').annotate(
+        books_count=Count('books'),
+        views=Coalesce(Sum('books__counters__views'), 0),
+        downloads=Coalesce(Sum('books__counters__downloads'), 0),
+        favorites=Coalesce(Sum('books__counters__favorites'), 0),
+    )
+
+
+def compute_directions():
+    return DirectionStatsSerializer(grouped(BookDirection), many=True).data
+
+
+def compute_genres():
+    return GenreStatsSerializer(grouped(Genre), many=True).data
+
+
+def cached_aggregate(name, compute):
+    key = f'{KEY_PREFIX}:aggregate:{name}'
+    current = generation('stats')
+    entry = cache.get(key)
+    token = None
+    if entry is not None:
+        fresh = entry['generation'] == current
+        if fresh or time.time() - entry['at'] < REFRESH_INTERVAL:
+            return entry['data']
+        token = acquire_lock(f'{key}:lock', REFRESH_INTERVAL)
+        if token is None:
+            return entry['data']
+    try:
+        data = [dict(row) for row in compute()]
+        cache.set(key, {'generation': current, 'at': time.time(), 'data': data}, timeout=None)
+    finally:
+        release_lock(f'{key}:lock', token)
+    return data
+
+
+def direction_stats():
+    return cached_aggregate('directions', compute_directions)
+
+
+def genre_stats():
+    return cached_aggregate('genres', compute_genres)
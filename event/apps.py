@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class EventConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'event'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import signals
+        from .search import ensure_triggers
+        post_migrate.connect(ensure_triggers, sender=self)
@@ -0,0 +1,133 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.core.cache import cache
+
+from .cache import bump
+
+GENERATION_KEY = 'autocomplete:gen'
+MAX_AGE = 60 * 10
+# поколение в общем кэше сверяем не чаще раза в секунду — подсказка не ходит в redis
+CHECK_INTERVAL = 1
+# сколько записей из диапазона префикса просматриваем, прежде чем остановиться
+SCAN_FACTOR = 20
+
+NON_WORD_RE = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(NON_WORD_RE.sub(' ', (text or '').casefold().replace('ё', 'е')).split())
+
+
+def book_terms(title, author):
+    # (строка, приоритет): целиком название/автор — 0, хвосты названия с каждого слова — 1
+    terms = set()
+    title = normalize(title)
+    author = normalize(author)
+    if title:
+        terms.add((title, 0))
+        words = title.split(' ')
+        for i in range(1, len(words)):
+            terms.add((' '.join(words[i:]), 1))
+    if author:
+        terms.add((author, 0))
+    return terms
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.built_at = 0
+        self.checked_at = 0
+        self.entries = []
+        self.books = {}
+
+    def _add(self, pk, title, author):
+        terms = book_terms(title, author)
+        self.books[pk] = (title, author, terms)
+        for term, rank in terms:
+            insort(self.entries, (term, rank, pk))
+
+    def _discard(self, pk):
+        book = self.books.pop(pk, None)
+        if book is None:
+            return
+        for term, rank in book[2]:
+            position = bisect_left(self.entries, (term, rank, pk))
+            if position < len(self.entries) and self.entries[position] == (term, rank, pk):
+                del self.entries[position]
+
+    def _rebuild(self, generation):
+        from .models import Book
+        books = {}
+        entries = []
+        for pk, title, author in Book.objects.values_list('id', 'title', 'author').iterator():
+            terms = book_terms(title, author)
+            books[pk] = (title, author, terms)
+            entries.extend((term, rank, pk) for term, rank in terms)
+        entries.sort()
+        self.books = books
+        self.entries = entries
+        self.generation = generation
+        self.built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self.generation is not None and now - self.checked_at < CHECK_INTERVAL:
+            return
+        self.checked_at = now
+        generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+        if generation != self.generation or time.monotonic() - self.built_at > MAX_AGE:
+            self._rebuild(generation)
+
+    def _bump(self):
+        generation = bump(GENERATION_KEY)
+        if self.generation is not None and generation == self.generation + 1:
+            self.generation = generation
+        else:
+            self.generation = None
+
+    def suggest(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        with self.lock:
+            self._ensure_fresh()
+            start = bisect_left(self.entries, (prefix,))
+            matches = []
+            for term, rank, pk in self.entries[start:start + limit * SCAN_FACTOR]:
+                if not term.startswith(prefix):
+                    break
+                matches.append((rank, len(term), pk))
+            matches.sort()
+            suggestions = []
+            seen = set()
+            for rank, length, pk in matches:
+                if pk in seen:
+                    continue
+                seen.add(pk)
+                title, author, terms = self.books[pk]
+                suggestions.append({'id': pk, 'title': title, 'author': author})
+                if len(suggestions) == limit:
+                    break
+            return suggestions
+
+    def book_saved(self, book):
+        with self.lock:
+            current = self.books.get(book.pk)
+            if current is not None and current[:2] == (book.title, book.author):
+                return
+            self._discard(book.pk)
+            self._add(book.pk, book.title, book.author)
+            self._bump()
+
+    def book_deleted(self, book):
+        with self.lock:
+            self._discard(book.pk)
+            self._bump()
+
+
+prefix_index = PrefixIndex()
@@ -0,0 +1,98 @@
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# увеличить, если меняется формат ответа — старые записи перестанут читаться
+REPRESENTATION_VERSION = 1
+TIMEOUT = 60 * 15
+
+KEY_PREFIX = 'catalog'
+STATS_KEYS = ('hits', 'misses')
+
+
+def generation(namespace):
+    return cache.get_or_set(f'{KEY_PREFIX}:gen:{namespace}', 1, timeout=None)
+
+
+def _count(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # ключ успел протухнуть/вытесниться между add и incr
+        cache.set(key, 1, timeout=None)
+
+
+def object_namespace(namespace, pk):
+    return f'{namespace}:{pk}'
+
+
+def make_key(namespace, request, scopes=()):
+    # scopes — дополнительные поколения, например одной книги
+    query = request.GET.urlencode()
+    generations = ':'.join(str(generation(name)) for name in (namespace, *scopes))
+    return f'{KEY_PREFIX}:{namespace}:{generations}:v{REPRESENTATION_VERSION}:{request.path}?{query}'
+
+
+def bump(key):
+    # счётчик поколений без TTL; возвращает новое значение
+    cache.add(key, 1, timeout=None)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+        return 2
+
+
+def invalidate(*namespaces):
+    # новая генерация — старые ключи больше не собираются и умирают по TIMEOUT
+    for namespace in namespaces:
+        bump(f'{KEY_PREFIX}:gen:{namespace}')
+
+
+def invalidate_objects(namespace, pks):
+    # только ответы про эти объекты (cached_response(..., per_object=True))
+    for pk in pks:
+        bump(f'{KEY_PREFIX}:gen:{object_namespace(namespace, pk)}')
+
+
+def acquire_lock(key, timeout):
+    # замок на cache.add; возвращает токен владельца или None, если замок занят
+    token = uuid.uuid4().hex
+    return token if cache.add(key, token, timeout=timeout) else None
+
+
+def release_lock(key, token):
+    # снимаем только свой замок: если наш протух и его взял другой процесс,
+    # его не трогаем. get и delete не атомарны, но окно между ними — один
+    # запрос к кэшу против целого TTL у безусловного delete
+    if token is not None and cache.get(key) == token:
+        cache.delete(key)
+
+
+def get_stats():
+    values = cache.get_many([f'{KEY_PREFIX}:stats:{name}' for name in STATS_KEYS])
+    return {name: values.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in STATS_KEYS}
+
+
+def cached_response(namespace, per_object=False):
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            scopes = (object_namespace(namespace, kwargs['pk']), ) if per_object else ()
+            key = make_key(namespace, request, scopes)
+            data = cache.get(key)
+            if data is not None:
+                _count('hits')
+                return Response(data)
+            _count('misses')
+            response = view_method(view, request, *args, **kwargs)
+            # StreamingHttpResponse и ошибки не кэшируем
+            if isinstance(response, Response) and response.status_code == 200:
+                cache.set(key, response.data, TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,199 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .cache import invalidate, invalidate_objects
+from .models import Book, BookCounters, Comment, Favorite, ViewsStats
+
+logger = logging.getLogger(__name__)
+
+# Просмотры/скачивания копятся в памяти процесса и пишутся пачкой раз в
+# STATS_FLUSH_INTERVAL секунд или при STATS_FLUSH_SIZE событиях. Флаги только
+# включаются, поэтому порядок событий не важен: (user, book) -> {v_count, d_count}.
+# STATS_FLUSH_INTERVAL = 0 — писать сразу, без буфера.
+
+
+class StatsBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.flushed_at = time.monotonic()
+        self.thread = None
+
+    def record(self, user_id, book_id, view=False, down=False):
+        with self.lock:
+            flags = self.pending.setdefault((user_id, book_id), set())
+            if view:
+                flags.add('v_count')
+            if down:
+                flags.add('d_count')
+            due = len(self.pending) >= settings.STATS_FLUSH_SIZE or \
+                time.monotonic() - self.flushed_at >= settings.STATS_FLUSH_INTERVAL
+        if due:
+            # запись статистики не должна ронять запрос, который её вызвал
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать статистику просмотров')
+        else:
+            self.start()
+
+    def start(self):
+        # фоновый поток дописывает хвост, если новых событий долго нет
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='stats-flush', daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            time.sleep(settings.STATS_FLUSH_INTERVAL)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать статистику просмотров')
+            finally:
+                close_old_connections()
+            with self.lock:
+                if not self.pending:
+                    self.thread = None
+                    return
+
+    def restore(self, pending):
+        # несохранённые события возвращаются в буфер к тем, что пришли за это время
+        with self.lock:
+            for key, flags in pending.items():
+                self.pending.setdefault(key, set()).update(flags)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.flushed_at = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            try:
+                write(pending)
+            except IntegrityError:
+                # книгу или пользователя успели удалить — выкидываем их события
+                write(existing_only(pending))
+        except OperationalError:
+            # БД недоступна или занята: повторим при следующем сбросе
+            self.restore(pending)
+            self.start()
+            logger.exception('Не удалось записать статистику просмотров, %s событий отложено', len(pending))
+            return 0
+        # агрегаты и карточки затронутых книг; 'books' целиком при сбросе раз в
+        # несколько секунд выметал бы весь кэш каталога — в списках total_views/
+        # total_down отстают не больше чем на cache.TIMEOUT
+        invalidate('stats')
+        invalidate_objects('books', {book_id for _, book_id in pending})
+        return len(pending)
+
+
+def write(pending):
+    with transaction.atomic():
+        ViewsStats.objects.bulk_create(
+            [ViewsStats(user_id=user_id, book_id=book_id) for user_id, book_id in pending], ignore_conflicts=True,
+        )
+        add_counts(switch_flags(pending))
+
+
+COUNTED_FLAGS = {'v_count': 'views', 'd_count': 'downloads'}
+
+
+def switch_flags(pending):
+    # флаг включаем условным UPDATE ... WHERE flag = false: строка, которую уже
+    # включил другой процесс, не попадёт в число затронутых, и BookCounters растут
+    # ровно на число действительно включённых флагов — без чтения «до» и гонки
+    # между параллельными сбросами
+    groups = {}
+    for (user_id, book_id), flags in pending.items():
+        for flag in flags:
+            groups.setdefault((flag, book_id), []).append(user_id)
+    deltas = {}
+    for (flag, book_id), user_ids in groups.items():
+        switched = ViewsStats.objects.filter(book_id=book_id, user_id__in=user_ids, **{flag: False}) \
+            .update(**{flag: True})
+        if switched:
+            book = deltas.setdefault(book_id, {})
+            book[COUNTED_FLAGS[flag]] = book.get(COUNTED_FLAGS[flag], 0) + switched
+    return deltas
+
+
+def existing_only(pending):
+    User = ViewsStats._meta.get_field('user').related_model
+    books = set(Book.objects.filter(id__in={book_id for _, book_id in pending}).values_list('id', flat=True))
+    users = set(User.objects.filter(id__in={user_id for user_id, _ in pending}).values_list('id', flat=True))
+    return {key: flags for key, flags in pending.items() if key[0] in users and key[1] in books}
+
+
+stats_buffer = StatsBuffer()
+
+
+COUNTER_FIELDS = ('views', 'downloads', 'favorites', 'comments')
+
+
+def add_counts(deltas):
+    # deltas: {book_id: {'views': 1, 'comments': -1, ...}} — одним UPDATE через F();
+    # книги без строки BookCounters пропускаются, их создаст reconcile_counters.
+    # Счётчики PositiveIntegerField: если они разошлись с данными и уже 0,
+    # уменьшение не должно ронять удаление на CHECK, поэтому снизу режем нулём
+    updates = {}
+    for name in COUNTER_FIELDS:
+        whens = [When(book_id=book_id, then=Value(delta[name]))
+                 for book_id, delta in deltas.items() if delta.get(name)]
+        if whens:
+            delta = Case(*whens, default=Value(0), output_field=IntegerField())
+            updates[name] = Greatest(F(name) + delta, Value(0), output_field=IntegerField())
+    if updates:
+        BookCounters.objects.filter(book_id__in=list(deltas)).update(**updates)
+
+
+def count_of(model, **filters):
+    rows = model.objects.filter(book=OuterRef('pk'), **filters).order_by().values('book')
+    return Coalesce(Subquery(rows.annotate(total=Count('*')).values('total')), 0)
+
+
+def rebuild_counters(book_ids=None, batch_size=1000):
+    # пересчёт из исходных таблиц за один проход по книгам
+    # имена аннотаций с префиксом: favorites/comments заняты обратными связями Book
+    queryset = Book.objects.order_by('id').annotate(
+        n_views=count_of(ViewsStats, v_count=True),
+        n_downloads=count_of(ViewsStats, d_count=True),
+        n_favorites=count_of(Favorite),
+        n_comments=count_of(Comment),
+    ).values_list('id', *(f'n_{name}' for name in COUNTER_FIELDS))
+    if book_ids is not None:
+        queryset = queryset.filter(id__in=book_ids)
+    rows = []
+    total = 0
+    for book_id, *values in queryset.iterator(chunk_size=batch_size):
+        rows.append(BookCounters(book_id=book_id, **dict(zip(COUNTER_FIELDS, values))))
+        if len(rows) >= batch_size:
+            total += save_counters(rows)
+            rows = []
+    total += save_counters(rows)
+    return total
+
+
+def save_counters(rows):
+    BookCounters.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=['book'], update_fields=list(COUNTER_FIELDS),
+    )
+    return len(rows)
+
+
+@atexit.register
+def flush_on_exit():
+    try:
+        stats_buffer.flush()
+    except Exception:
+        logger.exception('Не удалось записать статистику просмотров при завершении')
+    finally:
+        connection.close()
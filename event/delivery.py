@@ -0,0 +1,119 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header, http_date, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeFile:
+    # отдаёт length байт начиная с текущей позиции; fileno() оставлен,
+    # чтобы gunicorn мог отправить кусок через os.sendfile
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat):
+    return quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}')
+
+
+def etag_matches(header, etag):
+    # If-None-Match сравнивается слабо (RFC 9110, 13.1.2): W/"x" совпадает с "x"
+    tags = parse_etags(header)
+    return tags == ['*'] or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+def parse_range(header, size):
+    # один диапазон; несколько диапазонов не поддерживаем — отдаём файл целиком
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, end
+
+
+def serve_file(request, field_file, filename):
+    """
+    Отдаёт файл с поддержкой Range/If-None-Match/If-Range.
+
+    Если задан settings.PDF_SENDFILE_HEADER (X-Accel-Redirect или X-Sendfile),
+    тело отдаёт фронтовой прокси, а Django только проверяет доступ.
+    """
+    path = field_file.path
+    stat = os.stat(path)
+    etag = file_etag(stat)
+
+    if etag_matches(request.headers.get('If-None-Match', ''), etag):
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    header = getattr(settings, 'PDF_SENDFILE_HEADER', '')
+    if header:
+        response = HttpResponse(content_type='application/pdf')
+        if header == 'X-Accel-Redirect':
+            # nginx раскодирует URI; кириллица и пробелы в имени иначе ломают заголовок
+            response[header] = settings.PDF_ACCEL_PREFIX.rstrip('/') + '/' + quote(field_file.name)
+        else:
+            response[header] = path
+        response['ETag'] = etag
+        response['Content-Disposition'] = content_disposition_header(False, filename)
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = open(path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206,
+                                content_type='application/pdf', filename=filename)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        response = FileResponse(file, content_type='application/pdf', filename=filename)
+        response['Content-Length'] = size
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
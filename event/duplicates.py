@@ -0,0 +1,126 @@
+import math
+from collections import Counter, defaultdict
+
+from django.db import transaction
+
+from .autocomplete import normalize
+from .models import Book
+
+NEAR_THRESHOLD = 0.75
+DELETE_BATCH = 500
+
+
+class DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        # без рекурсии: длинные цепочки не упираются в лимит глубины стека
+        root = self.parent.setdefault(item, item)
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while item != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def clusters(self):
+        groups = defaultdict(list)
+        for item in self.parent:
+            groups[self.find(item)].append(item)
+        return [sorted(ids) for ids in groups.values() if len(ids) > 1]
+
+
+def trigrams(text):
+    text = f' {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _book_keys(queryset):
+    # key = None, если название пустое: по одному автору книги не склеиваем
+    for pk, title, author, pdf in queryset.values_list('id', 'title', 'author', 'pdf').iterator():
+        title = normalize(title)
+        yield pk, f'{title}|{normalize(author)}' if title else None, pdf
+
+
+def exact_clusters(queryset=None):
+    # одинаковые нормализованные название+автор или один и тот же файл
+    # (в content-addressed хранилище одинаковое содержимое = одинаковое имя)
+    queryset = Book.objects.all() if queryset is None else queryset
+    by_key = {}
+    by_file = {}
+    clusters = DisjointSet()
+    for pk, key, pdf in _book_keys(queryset):
+        clusters.find(pk)
+        if key is not None:
+            if key in by_key:
+                clusters.union(pk, by_key[key])
+            else:
+                by_key[key] = pk
+        if pdf:
+            if pdf in by_file:
+                clusters.union(pk, by_file[pdf])
+            else:
+                by_file[pdf] = pk
+    return sorted(clusters.clusters())
+
+
+def near_clusters(queryset=None, threshold=NEAR_THRESHOLD):
+    # похожие названия: self-join по Jaccard триграмм с prefix filtering (AllPairs).
+    # Триграммы каждой книги упорядочены от редких к частым. Книги идут по
+    # возрастанию размера, поэтому для уже проиндексированной y |y| <= |x|, и при
+    # J(x, y) >= t общих триграмм не меньше ceil(t·|x|) и не меньше
+    # ceil(2t/(1+t)·|y|). Значит, префикс x длины |x| - ceil(t·|x|) + 1 обязан
+    # пересечься с префиксом y длины |y| - ceil(2t/(1+t)·|y|) + 1. В индексе
+    # лежат только короткие префиксы из самых редких триграмм — списки малы,
+    # а пары с J >= t не теряются.
+    queryset = Book.objects.all() if queryset is None else queryset
+    clusters = DisjointSet()
+    grams = {}
+    first_by_key = {}
+    for pk, key, pdf in _book_keys(queryset):
+        if key is None:
+            continue
+        # одинаковые ключи склеиваем сразу, в join идёт один представитель
+        if key in first_by_key:
+            clusters.union(pk, first_by_key[key])
+            continue
+        first_by_key[key] = pk
+        grams[pk] = trigrams(key)
+
+    frequency = Counter(gram for items in grams.values() for gram in items)
+    index_share = 2 * threshold / (1 + threshold)
+    index = defaultdict(list)
+    for pk in sorted(grams, key=lambda pk: len(grams[pk])):
+        items = grams[pk]
+        size = len(items)
+        ordered = sorted(items, key=lambda gram: (frequency[gram], gram))
+        candidates = set()
+        for gram in ordered[:size - _at_least(threshold * size) + 1]:
+            candidates.update(other for other in index[gram] if len(grams[other]) >= threshold * size)
+        for gram in ordered[:size - _at_least(index_share * size) + 1]:
+            index[gram].append(pk)
+        for other in candidates:
+            # J >= t  <=>  |x ∩ y| >= t/(1+t)·(|x| + |y|), объединение не строим
+            if len(items & grams[other]) >= _at_least(threshold / (1 + threshold) * (size + len(grams[other]))):
+                clusters.union(pk, other)
+    return sorted(clusters.clusters())
+
+
+def _at_least(value):
+    # ceil с допуском: 0.7 * 10 во float равно 7.000000000000001, а не 7
+    return math.ceil(value - 1e-9)
+
+
+def delete_duplicates(clusters):
+    # оставляем самую старую копию (наименьший id), остальное удаляем пачками
+    ids = [pk for cluster in clusters for pk in cluster[1:]]
+    deleted = 0
+    for start in range(0, len(ids), DELETE_BATCH):
+        with transaction.atomic():
+            deleted += Book.objects.filter(id__in=ids[start:start + DELETE_BATCH]).delete()[1].get('event.Book', 0)
+    return deleted
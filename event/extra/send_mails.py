@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from account.outbox import enqueue
 
 def send_guest_mail(user, event, count):
     message=f"""
@@ -15,10 +15,7 @@ def send_guest_mail(user, event, count):
         E-mail:
         {user.email}
         """
-    send_mail('Регистрация на событие',
-            message,
-            'eventorro@gmail.com',
-            [user.email, ])
+    enqueue(user.email, 'Регистрация на событие', message)
     return message
 
 
@@ -30,7 +27,4 @@ def send_host_mail(user, event, count):
         Фамилия {user.last_name}
         Имя     {user.name}
     """
-    send_mail('Новые заказы в организации',
-                message,
-                "eventorro@gmail.com",
-                [event.author.email, ])
\ No newline at end of file
+    enqueue(event.author.email, 'Новые заказы в организации', message)
\ No newline at end of file
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from event.models import UploadSession
+from event.uploads import discard
+
+
+class Command(BaseCommand):
+    help = 'Удаляет незавершённые загрузки PDF старше UPLOAD_SESSION_TTL вместе с временными файлами'
+
+    def handle(self, *args, **options):
+        deadline = timezone.now() - settings.UPLOAD_SESSION_TTL
+        stale = UploadSession.objects.filter(created_at__lt=deadline, book__isnull=True)
+        count = 0
+        for session in stale.iterator():
+            discard(session)
+            count += 1
+        # у завершённых сессий временного файла уже нет, сама запись больше не нужна
+        UploadSession.objects.filter(created_at__lt=deadline, book__isnull=False).delete()
+        self.stdout.write(self.style.SUCCESS(f'Удалено незавершённых загрузок: {count}'))
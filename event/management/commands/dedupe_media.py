@@ -0,0 +1,64 @@
+import os
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from event.models import Book, News
+from event.storage import ContentAddressedStorage, content_storage, file_sha256
+
+FILE_FIELDS = [(Book, 'pdf'), (Book, 'image1'), (News, 'image1')]
+
+
+class Command(BaseCommand):
+    help = 'Переносит PDF и обложки в content-addressed хранилище (blobs/), удаляя дубликаты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='только посчитать, ничего не менять')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        prefix = f'{ContentAddressedStorage.prefix}/'
+
+        names = set()
+        for model, field in FILE_FIELDS:
+            names.update(
+                model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                .exclude(**{f'{field}__startswith': prefix})
+                .values_list(field, flat=True).distinct()
+            )
+
+        groups = defaultdict(list)
+        missing = 0
+        for name in sorted(names):
+            path = content_storage.path(name)
+            if not os.path.isfile(path):
+                missing += 1
+                continue
+            groups[file_sha256(path)].append(name)
+
+        moved = removed = saved = 0
+        for sha256, group in groups.items():
+            blob = content_storage.blob_name(sha256, group[0])
+            duplicates = group if content_storage.exists(blob) else group[1:]
+            saved += sum(os.path.getsize(content_storage.path(name)) for name in duplicates)
+            if dry_run:
+                moved += len(group) - len(duplicates)
+                removed += len(duplicates)
+                continue
+
+            with transaction.atomic():
+                if not content_storage.exists(blob):
+                    content_storage.adopt(content_storage.path(group[0]), group[0], sha256)
+                    moved += 1
+                for model, field in FILE_FIELDS:
+                    model.objects.filter(**{f'{field}__in': group}).update(**{field: blob})
+            for name in duplicates:
+                content_storage.delete(name)
+                removed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"[dry-run] " if dry_run else ""}файлов: {len(names)}, уникальных: {len(groups)}, '
+            f'перенесено: {moved}, удалено дубликатов: {removed}, '
+            f'освобождено: {saved / 1024 / 1024:.1f} МБ, не найдено на диске: {missing}'
+        ))
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+
+from event.cache import invalidate
+from event.models import Book
+from event.pdfmeta import PDFError, read_metadata
+from event.tasks import mark_pdf_corrupt, save_pdf_metadata
+
+
+BATCH_SIZE = 500
+
+
+def books_by_id(ids):
+    for start in range(0, len(ids), BATCH_SIZE):
+        batch = ids[start:start + BATCH_SIZE]
+        books = Book.objects.only('id', 'pdf', 'pages').in_bulk(batch)
+        yield from (books[pk] for pk in batch if pk in books)
+
+
+class Command(BaseCommand):
+    help = 'Разбирает PDF книг: число страниц, год, /Info; битые файлы помечает как corrupt'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--all', action='store_true', help='разобрать заново и уже разобранные')
+
+    def handle(self, *args, **options):
+        queryset = Book.objects.exclude(pdf='').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(pdf_status='pending')
+        # id забираем заранее: цикл меняет pdf_status тех же строк, а итерировать
+        # курсор по изменяемой выборке на SQLite нельзя
+        ids = list(queryset.values_list('id', flat=True))
+        total = len(ids)
+        storage = Book._meta.get_field('pdf').storage
+
+        done = failed = 0
+        # в очереди пула держим не больше workers * 4 файлов, чтобы не тянуть
+        # всю библиотеку в память; ORM — только в основном процессе
+        limit = options['workers'] * 4
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            pending = {}
+            books = books_by_id(ids)
+            while True:
+                for book in books:
+                    pending[pool.submit(read_metadata, storage.path(book.pdf.name))] = book
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    book = pending.pop(future)
+                    try:
+                        save_pdf_metadata(book, future.result())
+                        done += 1
+                    except (PDFError, OSError) as error:
+                        mark_pdf_corrupt(book, error)
+                        failed += 1
+                        self.stderr.write(f'Book #{book.pk} ({book.pdf.name}): {error}')
+                    if (done + failed) % 100 == 0:
+                        self.stdout.write(f'{done + failed}/{total}')
+
+        invalidate('books')
+        self.stdout.write(self.style.SUCCESS(f'Готово: {done}, повреждённых: {failed}'))
@@ -0,0 +1,48 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from event.cache import invalidate
+from event.models import Book, News
+from event.thumbnails import render_variants, variants_for
+
+
+class Command(BaseCommand):
+    help = 'Делает превью (WebP/JPEG) для обложек книг и новостей, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--all', action='store_true', help='пересчитать и те, у кого превью уже есть')
+
+    def handle(self, *args, **options):
+        jobs = {}
+        for model in (Book, News):
+            queryset = model.objects.exclude(image1='').exclude(image1__isnull=True)
+            if not options['all']:
+                queryset = queryset.filter(image1_variants={})
+            for pk, name in queryset.values_list('id', 'image1').iterator():
+                jobs[(model, pk)] = name
+
+        done = failed = 0
+        # Pillow в отдельных процессах, ORM — только здесь, в основном
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            futures = {
+                pool.submit(render_variants, Book._meta.get_field('image1').storage.path(name)): (model, pk, name)
+                for (model, pk), name in jobs.items()
+            }
+            for future in as_completed(futures):
+                model, pk, name = futures[future]
+                try:
+                    rendered = future.result()
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(f'{model.__name__} #{pk} ({name}): {error}')
+                    continue
+                model.objects.filter(pk=pk, image1=name).update(image1_variants=variants_for(name, rendered))
+                done += 1
+                if done % 100 == 0:
+                    self.stdout.write(f'{done}/{len(jobs)}')
+
+        invalidate('books', 'news')
+        self.stdout.write(self.style.SUCCESS(f'Готово: {done}, ошибок: {failed}'))
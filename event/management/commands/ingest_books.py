@@ -0,0 +1,223 @@
+import csv
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from account.models import AbstractUser
+from event import autocomplete, sampler
+from event.cache import bump, invalidate
+from event.models import Book, BookCounters, BookDirection, Genre
+from event.pdfmeta import PDFError, has_pdf_header, read_metadata
+from event.storage import ContentAddressedStorage, content_storage
+
+READ_SIZE = 1024 * 1024
+COLUMNS = ('pdf', 'title', 'author', 'direction')
+OPTIONAL_COLUMNS = ('description', 'genre', 'year', 'pages', 'image', 'author_email')
+
+
+def init_worker():
+    # при spawn (macOS/Windows) дочерний процесс стартует без настроенного Django
+    django.setup()
+
+
+def copy_to_storage(path):
+    # хэш считаем по ходу копирования во временный файл рядом с blobs/,
+    # затем adopt() переименовывает его в blobs/ab/cd/<sha256>.<ext>
+    directory = content_storage.path(ContentAddressedStorage.prefix)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source, \
+            tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False) as tmp:
+        for data in iter(lambda: source.read(READ_SIZE), b''):
+            digest.update(data)
+            tmp.write(data)
+    return content_storage.adopt(tmp.name, os.path.basename(path), digest.hexdigest())
+
+
+def prepare(pdf_path, image_path=None):
+    # выполняется в пуле процессов: проверка, разбор и копирование файлов, без ORM
+    with open(pdf_path, 'rb') as file:
+        if not has_pdf_header(file):
+            raise PDFError('Файл не является PDF')
+    try:
+        metadata, status = read_metadata(pdf_path), 'ok'
+    except PDFError as error:
+        metadata, status = {'error': str(error)}, 'corrupt'
+    return {
+        'pdf': copy_to_storage(pdf_path),
+        'image1': copy_to_storage(image_path) if image_path else None,
+        'pdf_status': status,
+        'pdf_metadata': metadata,
+        'size': os.path.getsize(pdf_path),
+    }
+
+
+def read_manifest(path):
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        rows = data.get('books', []) if isinstance(data, dict) else data
+        return [{key: str(value).strip() if value is not None else '' for key, value in row.items()}
+                for row in rows]
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        return [{(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+                for row in csv.DictReader(file)]
+
+
+def to_int(value):
+    try:
+        return int(float(value)) if value else None
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Массовая загрузка книг по манифесту (CSV или JSON): колонки pdf, title, author, direction '
+            '[, description, genre, year, pages, image, author_email]; пути — относительно манифеста. '
+            'Обработанные строки записываются в <манифест>.done, повторный запуск продолжает с места остановки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--dry-run', action='store_true', help='только проверить манифест')
+
+    def handle(self, *args, **options):
+        manifest = os.path.abspath(options['manifest'])
+        if not os.path.exists(manifest):
+            raise CommandError(f'Нет файла {manifest}')
+        root = os.path.dirname(manifest)
+        journal = f'{manifest}.done'
+        done = set()
+        if os.path.exists(journal):
+            with open(journal, encoding='utf-8') as file:
+                done = {line.rstrip('\n') for line in file if line.strip()}
+
+        directions = {direction.name: direction.id for direction in BookDirection.objects.all()}
+        self.genres = {genre.name: genre.id for genre in Genre.objects.all()}
+        rows = self.validate(read_manifest(manifest), root, directions, done)
+        self.stdout.write(f'К загрузке: {len(rows)}, уже загружено ранее: {len(done)}')
+        if options['dry_run'] or not rows:
+            return
+
+        self.ensure_genres(rows)
+        emails = {row['author_email'] for row in rows if row['author_email']}
+        self.authors = dict(AbstractUser.objects.filter(email__in=emails).values_list('email', 'id'))
+
+        self.started = time.monotonic()
+        self.created = self.skipped = self.failed = self.bytes = 0
+        self.total = len(rows)
+        batch = []
+        limit = options['workers'] * 4
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=init_worker) as pool, \
+                open(journal, 'a', encoding='utf-8') as journal_file:
+            pending = {}
+            queue = iter(rows)
+            while True:
+                # в работе не больше workers * 4 файлов
+                for row in queue:
+                    pending[pool.submit(prepare, row['pdf_path'], row['image_path'])] = row
+                    if len(pending) >= limit:
+                        break
+                if not pending:
+                    break
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    row = pending.pop(future)
+                    try:
+                        batch.append((row, future.result()))
+                    except (PDFError, OSError) as error:
+                        self.failed += 1
+                        self.stderr.write(f'{row["pdf"]}: {error}')
+                if len(batch) >= options['batch_size']:
+                    self.insert(batch, journal_file)
+                    batch = []
+            self.insert(batch, journal_file)
+
+        invalidate('books', 'stats')
+        # индексы случайной выборки и автодополнения во всех процессах пересоберутся
+        bump(sampler.GENERATION_KEY)
+        bump(autocomplete.GENERATION_KEY)
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {elapsed:.1f} с: добавлено {self.created}, дубликатов {self.skipped}, ошибок {self.failed}'
+        ))
+        if any(row['image_path'] for row in rows):
+            self.stdout.write('Превью обложек: python manage.py generate_thumbnails')
+
+    def validate(self, rows, root, directions, done):
+        valid = []
+        for number, row in enumerate(rows, start=1):
+            row = {column: row.get(column, '') for column in COLUMNS + OPTIONAL_COLUMNS}
+            if row['pdf'] in done:
+                continue
+            missing = [column for column in COLUMNS if not row[column]]
+            if missing:
+                self.stderr.write(f'Строка {number}: нет {", ".join(missing)}')
+                continue
+            if row['direction'] not in directions:
+                self.stderr.write(f'Строка {number}: неизвестное направление {row["direction"]}')
+                continue
+            row['direction_id'] = directions[row['direction']]
+            row['pdf_path'] = os.path.join(root, row['pdf'])
+            row['image_path'] = os.path.join(root, row['image']) if row['image'] else None
+            for key in ('pdf_path', 'image_path'):
+                if row[key] and not os.path.isfile(row[key]):
+                    self.stderr.write(f'Строка {number}: нет файла {row[key]}')
+                    break
+            else:
+                valid.append(row)
+        return valid
+
+    def ensure_genres(self, rows):
+        # жанры, как и в create_book, создаются по имени — недостающие одним запросом
+        missing = {row['genre'] for row in rows if row['genre'] and row['genre'] not in self.genres}
+        if missing:
+            Genre.objects.bulk_create([Genre(name=name) for name in sorted(missing)])
+            self.genres = dict(Genre.objects.values_list('name', 'id'))
+
+    def insert(self, batch, journal_file):
+        if not batch:
+            return
+        # одна и та же книга (тот же PDF) уже есть в каталоге или дважды в манифесте
+        existing = set(Book.objects.filter(pdf__in=[result['pdf'] for _, result in batch])
+                       .values_list('pdf', flat=True))
+        books = []
+        for row, result in batch:
+            self.bytes += result['size']
+            if result['pdf'] in existing:
+                self.skipped += 1
+                continue
+            existing.add(result['pdf'])
+            metadata = result['pdf_metadata']
+            books.append(Book(
+                title=row['title'], author=row['author'], description=row['description'],
+                direction_id=row['direction_id'], genre_id=self.genres.get(row['genre']),
+                author_account_id=self.authors.get(row['author_email']),
+                # год из /CreationDate — дата файла, а не издания; он остаётся в pdf_metadata
+                year=to_int(row['year']),
+                pages=to_int(row['pages']) or metadata.get('pages'),
+                pdf=result['pdf'], image1=result['image1'],
+                pdf_status=result['pdf_status'], pdf_metadata=metadata,
+            ))
+        # bulk_create не шлёт сигналы — строки BookCounters создаём сами
+        with transaction.atomic():
+            Book.objects.bulk_create(books)
+            BookCounters.objects.bulk_create([BookCounters(book_id=book.id) for book in books])
+        journal_file.write(''.join(f'{row["pdf"]}\n' for row, _ in batch))
+        journal_file.flush()
+        self.created += len(books)
+
+        elapsed = time.monotonic() - self.started
+        processed = self.created + self.skipped + self.failed
+        self.stdout.write(
+            f'{processed}/{self.total}: {processed / elapsed:.1f} файлов/с, '
+            f'{self.bytes / elapsed / 1024 / 1024:.1f} МБ/с'
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from event.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает FTS5-индекс книг (event_book_fts)'
+
+    def handle(self, *args, **options):
+        if rebuild_index():
+            self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
+        else:
+            self.stdout.write(self.style.WARNING('FTS5 доступен только на SQLite, пропущено'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from event.cache import invalidate
+from event.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает BookCounters (просмотры, скачивания, избранное, комментарии) по исходным таблицам'
+
+    def handle(self, *args, **options):
+        total = rebuild_counters()
+        invalidate('books', 'stats')
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано книг: {total}'))
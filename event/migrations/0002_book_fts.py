@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# FTS5-индекс по event_book (external content), синхронизируется триггерами
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS event_book_fts USING fts5(
+        title, author, description,
+        content='event_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_book_fts_ai AFTER INSERT ON event_book BEGIN
+        INSERT INTO event_book_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_book_fts_ad AFTER DELETE ON event_book BEGIN
+        INSERT INTO event_book_fts(event_book_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS event_book_fts_au AFTER UPDATE OF title, author, description ON event_book BEGIN
+        INSERT INTO event_book_fts(event_book_fts, rowid, title, author, description)
+        VALUES ('delete', old.id, old.title, old.author, old.description);
+        INSERT INTO event_book_fts(rowid, title, author, description)
+        VALUES (new.id, new.title, new.author, new.description);
+    END
+    """,
+    "INSERT INTO event_book_fts(event_book_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS event_book_fts_ai",
+    "DROP TRIGGER IF EXISTS event_book_fts_ad",
+    "DROP TRIGGER IF EXISTS event_book_fts_au",
+    "DROP TABLE IF EXISTS event_book_fts",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
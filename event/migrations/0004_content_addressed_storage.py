@@ -0,0 +1,29 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:46
+
+from django.db import migrations, models
+import event.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0003_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='book',
+            name='image1',
+            field=models.ImageField(blank=True, null=True, storage=event.storage.get_content_storage, upload_to='media/images/'),
+        ),
+        migrations.AlterField(
+            model_name='book',
+            name='pdf',
+            field=models.FileField(db_index=True, storage=event.storage.get_content_storage, upload_to='books/%Y'),
+        ),
+        migrations.AlterField(
+            model_name='news',
+            name='image1',
+            field=models.ImageField(blank=True, null=True, storage=event.storage.get_content_storage, upload_to='media/images/'),
+        ),
+    ]
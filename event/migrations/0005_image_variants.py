@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0004_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='image1_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='news',
+            name='image1_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0005_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='pdf_metadata',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='pdf_status',
+            field=models.CharField(choices=[('pending', 'Ожидает разбора'), ('ok', 'Разобран'), ('corrupt', 'Повреждён')], default='pending', editable=False, max_length=10),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    # до ограничения дубли (user, book) сливаются в одну запись: флаги — по «или»
+    ViewsStats = apps.get_model('event', 'ViewsStats')
+    keep = {}
+    extra = []
+    for row in ViewsStats.objects.order_by('id').values('id', 'user_id', 'book_id', 'v_count', 'd_count'):
+        key = (row['user_id'], row['book_id'])
+        if key not in keep:
+            keep[key] = row
+            continue
+        first = keep[key]
+        if (row['v_count'] and not first['v_count']) or (row['d_count'] and not first['d_count']):
+            first['v_count'] |= row['v_count']
+            first['d_count'] |= row['d_count']
+            first['changed'] = True
+        extra.append(row['id'])
+    for row in keep.values():
+        if row.get('changed'):
+            ViewsStats.objects.filter(id=row['id']).update(v_count=row['v_count'], d_count=row['d_count'])
+    for start in range(0, len(extra), 500):
+        ViewsStats.objects.filter(id__in=extra[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0006_pdf_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='viewsstats',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='unique_views_stats'),
+        ),
+    ]
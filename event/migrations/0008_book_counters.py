@@ -0,0 +1,46 @@
+# Generated by Django 4.2.9 on 2026-10-18 08:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('event', 'Book')
+    BookCounters = apps.get_model('event', 'BookCounters')
+    counts = {}
+
+    def collect(model_name, field, **filters):
+        rows = apps.get_model('event', model_name).objects.filter(**filters).order_by().values('book')
+        for row in rows.annotate(total=models.Count('*')):
+            counts.setdefault(row['book'], {})[field] = row['total']
+
+    collect('ViewsStats', 'views', v_count=True)
+    collect('ViewsStats', 'downloads', d_count=True)
+    collect('Favorite', 'favorites')
+    collect('Comment', 'comments')
+    BookCounters.objects.bulk_create(
+        [BookCounters(book_id=book_id, **counts.get(book_id, {}))
+         for book_id in Book.objects.values_list('id', flat=True)],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('event', '0007_unique_views_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookCounters',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to='event.book')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('favorites', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
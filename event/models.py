@@ -1,6 +1,12 @@
+import os
+import uuid
+
 from django.db import models
+from django.db.models import Prefetch
 from account.models import AbstractUser as User
-from afiche import settings
+from django.conf import settings
+from .storage import get_content_storage
+from .thumbnails import srcset
 
 from django.utils import timezone
 
@@ -25,6 +31,39 @@ class Genre(models.Model):
         return f'{self.name}'
 
 
+class BookQuerySet(models.QuerySet):
+    def for_listing(self, fields=None):
+        # всё, что читает BookListSerializer, за фиксированное число запросов;
+        # fields — те же ключи, что и у BookListSerializer(fields=...)
+        def wants(key):
+            return fields is None or key in fields
+
+        queryset = self
+        related = [name for name, key in (('author_account', 'author_account'),
+                                          ('genre', 'genres'),
+                                          ('direction', 'direction_name')) if wants(key)]
+        if wants('comments'):
+            queryset = queryset.prefetch_related(
+                Prefetch('comments', queryset=Comment.objects.select_related('user'))
+            )
+        if wants('stats'):
+            queryset = queryset.prefetch_related(
+                Prefetch('view_stats', queryset=ViewsStats.objects.select_related('user__group'))
+            )
+        if wants('total_views') or wants('total_down'):
+            related.append('counters')
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
+
+PDF_STATUSES = (
+    ('pending', 'Ожидает разбора'),
+    ('ok', 'Разобран'),
+    ('corrupt', 'Повреждён'),
+)
+
+
 class Book(models.Model):
     author_account = models.ForeignKey(User, on_delete=models.CASCADE, related_name='books', null=True, blank=True)
 
@@ -37,9 +76,15 @@ class Book(models.Model):
 
     pages = models.IntegerField(blank=True, null=True)
     year = models.IntegerField(blank=True, null=True)
-    pdf = models.FileField(upload_to='books/%Y')
+    pdf = models.FileField(upload_to='books/%Y', storage=get_content_storage, db_index=True)
+    # заполняет фоновая задача extract_pdf_metadata
+    pdf_status = models.CharField(max_length=10, choices=PDF_STATUSES, default='pending', editable=False)
+    pdf_metadata = models.JSONField(default=dict, blank=True, editable=False)
 
-    image1 = models.ImageField(upload_to=f'media/images/', null=True, blank=True)
+    image1 = models.ImageField(upload_to=f'media/images/', null=True, blank=True, storage=get_content_storage)
+    image1_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = BookQuerySet.as_manager()
 
     def __str__(self) -> str:
         return f"{self.title} ({str(self.year)}/{self.pages})"
@@ -54,6 +99,9 @@ class Book(models.Model):
         except ValueError:
             return 'Image Not Found'
 
+    def get_srcset(self):
+        return srcset(self.image1_variants, lambda name: f"{settings.LINK}{self.image1.storage.url(name)}")
+
     def get_pdf_url(self):
         try:
             pdf = getattr(self, 'pdf')
@@ -72,6 +120,11 @@ class ViewsStats(models.Model):
     d_count = models.BooleanField(default=False)
     v_count = models.BooleanField(default=False)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'book'), name='unique_views_stats'),
+        ]
+
     def __str__(self) -> str:
         return f'{self.user.email} -> {self.book.title}'
 
@@ -96,6 +149,19 @@ class Comment(models.Model):
             return 'deleted or someone'
 
 
+class BookCounters(models.Model):
+    # денормализованные счётчики; правятся сигналами через F(), сверяются
+    # командой reconcile_counters (event/counters.py)
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    views = models.PositiveIntegerField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    favorites = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return f'{self.book_id}: {self.views}/{self.downloads}/{self.favorites}/{self.comments}'
+
+
 class News(models.Model):
     author_account = models.ForeignKey(User, on_delete=models.CASCADE, related_name='news', null=True, blank=True)
 
@@ -104,11 +170,15 @@ class News(models.Model):
 
     news_date = models.DateTimeField(default=timezone.now)
 
-    image1 = models.ImageField(upload_to=f'media/images/', null=True, blank=True)
+    image1 = models.ImageField(upload_to=f'media/images/', null=True, blank=True, storage=get_content_storage)
+    image1_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self) -> str:
         return f"{self.title}"
 
+    def get_srcset(self):
+        return srcset(self.image1_variants, self.image1.storage.url)
+
     def get_image_url(self, field_name):
         try:
             image_field = getattr(self, field_name)
@@ -118,3 +188,42 @@ class News(models.Model):
                 return 'Image Not Found'
         except ValueError:
             return 'Image Not Found'
+
+
+class UploadSession(models.Model):
+    # докачиваемая загрузка PDF: куски пишутся сразу во временный файл на диске
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, related_name='upload_sessions', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    book = models.ForeignKey(Book, related_name='upload_sessions', on_delete=models.SET_NULL, null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f'{self.user.email} -> {self.filename} ({self.size})'
+
+    @property
+    def chunk_count(self):
+        return max((self.size + self.chunk_size - 1) // self.chunk_size, 1)
+
+    @property
+    def temp_path(self):
+        return os.path.join(settings.UPLOAD_TEMP_DIR, f'{self.id}.part')
+
+    def chunk_length(self, index):
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, related_name='chunks', on_delete=models.CASCADE)
+    index = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('session', 'index')
+
+    def __str__(self) -> str:
+        return f'{self.session_id} #{self.index}'
@@ -1,6 +1,109 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor
 
 class EventPagination(pagination.PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+
+
+class KeysetPagination(pagination.CursorPagination):
+    # ?cursor=...&limit=... — без COUNT(*) и OFFSET, по уникальному индексу id
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = 'id'
+
+    @classmethod
+    def is_requested(cls, request):
+        return cls.cursor_query_param in request.query_params or \
+            cls.page_size_query_param in request.query_params
+
+
+def paginated_response(request, view, queryset, serializer_class, **kwargs):
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, request, view=view)
+    return paginator.get_paginated_response(serializer_class(page, many=True, **kwargs).data)
+
+
+class SortableKeysetPagination(KeysetPagination):
+    # ?ordering=-views — по любому полю из view.ordering_fields (в т.ч. аннотации).
+    # Курсор составной: (значение, id) последней строки, следующая страница —
+    # WHERE value < v OR (value = v AND id < last_id), без OFFSET даже на длинных
+    # сериях одинаковых значений
+    ordering_param = 'ordering'
+
+    def get_ordering(self, request, queryset, view):
+        default = getattr(view, 'ordering', self.ordering)
+        value = request.query_params.get(self.ordering_param) or default
+        if value.lstrip('-') not in view.ordering_fields:
+            value = default
+        if value.lstrip('-') == 'id':
+            return (value, )
+        return (value, '-id' if value.startswith('-') else 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+
+        self.field = self.ordering[0].lstrip('-')
+        # назад по списку идём в обратном порядке и разворачиваем страницу
+        descending = self.ordering[0].startswith('-') != reverse
+        prefix = '-' if descending else ''
+        order = [f'{prefix}{self.field}'] if self.field == 'id' else [f'{prefix}{self.field}', f'{prefix}id']
+        queryset = queryset.order_by(*order)
+        if self.cursor and self.cursor.position is not None:
+            value, pk = self.decode_position(self.cursor.position)
+            lookup = 'lt' if descending else 'gt'
+            try:
+                queryset = queryset.filter(Q(**{f'{self.field}__{lookup}': value})
+                                           | Q(**{self.field: value, f'id__{lookup}': pk}))
+            except (TypeError, ValueError, ValidationError):
+                # значение не того типа, что поле сортировки
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = bool(self.cursor and self.cursor.position is not None)
+        return self.page
+
+    def decode_position(self, position):
+        # курсор приходит от клиента: [значение, id] проверяем, а не доверяем ему
+        try:
+            value, pk = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if type(pk) is not int or value is None or isinstance(value, (bool, list, dict)):
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+    def position(self, item):
+        return json.dumps([getattr(item, self.field), item.pk], cls=DjangoJSONEncoder)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.position(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.position(self.page[0])))
@@ -0,0 +1,475 @@
+import re
+import zlib
+
+# Читает из PDF число страниц и /Info, не загружая файл целиком: хвост файла →
+# startxref → таблицы/потоки xref (с цепочкой /Prev) → /Root → /Pages → /Count.
+# Модуль не трогает ORM — вызывается и из Celery, и из ProcessPoolExecutor.
+
+TAIL_SIZE = 4096
+READ_SIZE = 64 * 1024
+MAX_OBJECT_SIZE = 8 * 1024 * 1024
+SCAN_OVERLAP = 256
+
+WHITESPACE = b' \t\r\n\f\x00'
+DELIMITERS = b'()<>[]{}/%'
+DATE_RE = re.compile(r'^D?:?(\d{4})')
+PAGES_COUNT_RE = re.compile(rb'/Type\s*/Pages\b.{0,200}?/Count\s+(\d+)|/Count\s+(\d+).{0,200}?/Type\s*/Pages\b', re.S)
+
+
+class PDFError(Exception):
+    pass
+
+
+class Ref:
+    __slots__ = ('num', 'gen')
+
+    def __init__(self, num, gen):
+        self.num = num
+        self.gen = gen
+
+
+class Name(str):
+    pass
+
+
+class Stream:
+    def __init__(self, attrs, data):
+        self.attrs = attrs
+        self.data = data
+
+
+class Lexer:
+    def __init__(self, data, pos=0):
+        self.data = data
+        self.pos = pos
+
+    def skip_space(self):
+        data = self.data
+        while self.pos < len(data):
+            char = data[self.pos]
+            if char in WHITESPACE:
+                self.pos += 1
+            elif char == 0x25:  # % — комментарий до конца строки
+                while self.pos < len(data) and data[self.pos] not in b'\r\n':
+                    self.pos += 1
+            else:
+                break
+
+    def token(self):
+        self.skip_space()
+        data = self.data
+        if self.pos >= len(data):
+            raise PDFError('неожиданный конец данных')
+        start = self.pos
+        char = data[start:start + 1]
+        if char in (b'[', b']', b'{', b'}'):
+            self.pos += 1
+            return char
+        if data.startswith(b'<<', start) or data.startswith(b'>>', start):
+            self.pos += 2
+            return data[start:start + 2]
+        if char in (b'(', b'<', b'/'):
+            self.pos += 1
+            return char
+        while self.pos < len(data) and data[self.pos] not in WHITESPACE and data[self.pos] not in DELIMITERS:
+            self.pos += 1
+        if self.pos == start:
+            raise PDFError(f'неожиданный символ {char!r}')
+        return data[start:self.pos]
+
+    def read_name(self):
+        data = self.data
+        start = self.pos
+        while self.pos < len(data) and data[self.pos] not in WHITESPACE and data[self.pos] not in DELIMITERS:
+            self.pos += 1
+        raw = re.sub(rb'#([0-9A-Fa-f]{2})', lambda m: bytes([int(m.group(1), 16)]), data[start:self.pos])
+        return Name(raw.decode('latin-1'))
+
+    def read_literal(self):
+        data = self.data
+        out = bytearray()
+        depth = 1
+        while self.pos < len(data):
+            char = data[self.pos]
+            self.pos += 1
+            if char == 0x5C:  # backslash
+                if self.pos >= len(data):
+                    break
+                char = data[self.pos]
+                self.pos += 1
+                escapes = {0x6E: 10, 0x72: 13, 0x74: 9, 0x62: 8, 0x66: 12}
+                if char in escapes:
+                    out.append(escapes[char])
+                elif 0x30 <= char <= 0x37:
+                    digits = bytes([char])
+                    while len(digits) < 3 and self.pos < len(data) and 0x30 <= data[self.pos] <= 0x37:
+                        digits += data[self.pos:self.pos + 1]
+                        self.pos += 1
+                    out.append(int(digits, 8) & 0xFF)
+                elif char == 0x0D:
+                    if self.pos < len(data) and data[self.pos] == 0x0A:
+                        self.pos += 1
+                elif char != 0x0A:
+                    out.append(char)
+            elif char == 0x28:
+                depth += 1
+                out.append(char)
+            elif char == 0x29:
+                depth -= 1
+                if depth == 0:
+                    return bytes(out)
+                out.append(char)
+            else:
+                out.append(char)
+        raise PDFError('незакрытая строка')
+
+    def read_hex(self):
+        end = self.data.find(b'>', self.pos)
+        if end < 0:
+            raise PDFError('незакрытая hex-строка')
+        digits = re.sub(rb'[^0-9A-Fa-f]', b'', self.data[self.pos:end])
+        self.pos = end + 1
+        if len(digits) % 2:
+            digits += b'0'
+        return bytes.fromhex(digits.decode('ascii'))
+
+    def parse(self):
+        token = self.token()
+        if token == b'<<':
+            result = {}
+            while True:
+                self.skip_space()
+                if self.data.startswith(b'>>', self.pos):
+                    self.pos += 2
+                    return result
+                key = self.token()
+                if key != b'/':
+                    raise PDFError('ожидалось имя ключа словаря')
+                name = self.read_name()
+                result[name] = self.parse()
+        if token == b'[':
+            result = []
+            while True:
+                self.skip_space()
+                if self.data.startswith(b']', self.pos):
+                    self.pos += 1
+                    return result
+                result.append(self.parse())
+        if token == b'/':
+            return self.read_name()
+        if token == b'(':
+            return self.read_literal()
+        if token == b'<':
+            return self.read_hex()
+        if token == b'true':
+            return True
+        if token == b'false':
+            return False
+        if token == b'null':
+            return None
+        try:
+            number = float(token) if b'.' in token else int(token)
+        except ValueError:
+            raise PDFError(f'неизвестный токен {token[:20]!r}')
+        if isinstance(number, int):
+            # "12 0 R" — косвенная ссылка
+            saved = self.pos
+            try:
+                generation = self.token()
+                keyword = self.token()
+                if generation.isdigit() and keyword == b'R':
+                    return Ref(number, int(generation))
+            except PDFError:
+                pass
+            self.pos = saved
+        return number
+
+
+def png_unpredict(data, columns):
+    # PNG-предикторы (/Predictor >= 10), которыми обычно сжаты xref-потоки
+    row_size = columns + 1
+    previous = bytearray(columns)
+    out = bytearray()
+    for start in range(0, len(data) - row_size + 1, row_size):
+        kind = data[start]
+        row = bytearray(data[start + 1:start + row_size])
+        for i in range(columns):
+            left = row[i - 1] if i else 0
+            up = previous[i]
+            up_left = previous[i - 1] if i else 0
+            if kind == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif kind == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif kind == 3:
+                row[i] = (row[i] + ((left + up) >> 1)) & 0xFF
+            elif kind == 4:
+                p = left + up - up_left
+                pa, pb, pc = abs(p - left), abs(p - up), abs(p - up_left)
+                predictor = left if pa <= pb and pa <= pc else up if pb <= pc else up_left
+                row[i] = (row[i] + predictor) & 0xFF
+        out += row
+        previous = row
+    return bytes(out)
+
+
+def decode_stream(stream):
+    filters = stream.attrs.get('Filter')
+    params = stream.attrs.get('DecodeParms')
+    if isinstance(filters, list):
+        if len(filters) > 1:
+            raise PDFError('цепочки фильтров не поддерживаются')
+        filters = filters[0] if filters else None
+        params = params[0] if isinstance(params, list) and params else params
+    data = stream.data
+    if filters is None:
+        return data
+    if filters != 'FlateDecode':
+        raise PDFError(f'фильтр {filters} не поддерживается')
+    try:
+        data = zlib.decompress(data)
+    except zlib.error:
+        data = zlib.decompressobj().decompress(data)
+    if isinstance(params, dict) and params.get('Predictor', 1) >= 10:
+        data = png_unpredict(data, params.get('Columns', 1))
+    return data
+
+
+class PDFReader:
+    def __init__(self, file):
+        self.file = file
+        self.file.seek(0, 2)
+        self.size = self.file.tell()
+        self.xref = {}
+        self.trailer = {}
+        self.object_streams = {}
+
+    def read_at(self, offset, size):
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def header_version(self):
+        head = self.read_at(0, 1024)
+        position = head.find(b'%PDF-')
+        if position < 0:
+            raise PDFError('нет заголовка %PDF-')
+        return head[position + 5:position + 8].decode('latin-1', 'replace')
+
+    def startxref(self):
+        tail = self.read_at(max(self.size - TAIL_SIZE, 0), TAIL_SIZE)
+        position = tail.rfind(b'startxref')
+        if position < 0:
+            raise PDFError('нет startxref')
+        match = re.match(rb'startxref\s+(\d+)', tail[position:])
+        if not match:
+            raise PDFError('битый startxref')
+        return int(match.group(1))
+
+    def load_xref(self):
+        offset = self.startxref()
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            trailer = self.read_xref_section(offset)
+            # более новые секции уже записаны — старые не перетирают их
+            for key, value in trailer.items():
+                self.trailer.setdefault(key, value)
+            if 'XRefStm' in trailer:
+                self.read_xref_section(trailer['XRefStm'])
+            offset = trailer.get('Prev')
+
+    def read_xref_section(self, offset):
+        head = self.read_at(offset, 4)
+        if head == b'xref':
+            return self.read_xref_table(offset)
+        return self.read_xref_stream(offset)
+
+    def read_xref_table(self, offset):
+        self.file.seek(offset)
+        self.file.readline()
+        while True:
+            line = self.file.readline()
+            if not line:
+                raise PDFError('xref без trailer')
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith(b'trailer'):
+                position = self.file.tell() - len(line) + line.find(b'trailer') + len(b'trailer')
+                data = self.read_at(position, READ_SIZE)
+                return Lexer(data).parse()
+            parts = stripped.split()
+            if len(parts) != 2:
+                raise PDFError('битая подсекция xref')
+            start, count = int(parts[0]), int(parts[1])
+            data = self.file.read(count * 20)
+            for i in range(count):
+                entry = data[i * 20:i * 20 + 20].split()
+                if len(entry) < 3:
+                    raise PDFError('битая запись xref')
+                if entry[2] == b'n':
+                    self.xref.setdefault(start + i, ('n', int(entry[0])))
+
+    def read_xref_stream(self, offset):
+        stream = self.read_object_at(offset)
+        if not isinstance(stream, Stream) or stream.attrs.get('Type') != 'XRef':
+            raise PDFError('по смещению startxref нет xref')
+        widths = stream.attrs['W']
+        index = stream.attrs.get('Index', [0, stream.attrs['Size']])
+        data = decode_stream(stream)
+        entry_size = sum(widths)
+        position = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            for num in range(start, start + count):
+                entry = data[position:position + entry_size]
+                position += entry_size
+                fields = []
+                cursor = 0
+                for width in widths:
+                    fields.append(int.from_bytes(entry[cursor:cursor + width], 'big') if width else None)
+                    cursor += width
+                kind = 1 if fields[0] is None else fields[0]
+                if kind == 1:
+                    self.xref.setdefault(num, ('n', fields[1]))
+                elif kind == 2:
+                    self.xref.setdefault(num, ('c', fields[1], fields[2] or 0))
+        return stream.attrs
+
+    def read_object_at(self, offset):
+        size = READ_SIZE
+        while True:
+            data = self.read_at(offset, size)
+            lexer = Lexer(data)
+            try:
+                lexer.token()
+                lexer.token()
+                if lexer.token() != b'obj':
+                    raise PDFError(f'нет объекта по смещению {offset}')
+                value = lexer.parse()
+                lexer.skip_space()
+                if isinstance(value, dict) and data.startswith(b'stream', lexer.pos):
+                    start = lexer.pos + len(b'stream')
+                    if data[start:start + 2] == b'\r\n':
+                        start += 2
+                    elif data[start:start + 1] in (b'\n', b'\r'):
+                        start += 1
+                    length = self.resolve(value.get('Length'))
+                    if not isinstance(length, int):
+                        raise PDFError('у потока нет /Length')
+                    if start + length > len(data):
+                        if length > MAX_OBJECT_SIZE:
+                            raise PDFError('слишком большой поток')
+                        data = self.read_at(offset, start + length)
+                    return Stream(value, data[start:start + length])
+                return value
+            except PDFError:
+                # объект не поместился в прочитанный кусок — читаем больше
+                if len(data) < size or size >= MAX_OBJECT_SIZE:
+                    raise
+                size *= 4
+
+    def object_stream(self, num):
+        if num not in self.object_streams:
+            stream = self.get_object(num)
+            if not isinstance(stream, Stream):
+                raise PDFError('ссылка на несуществующий поток объектов')
+            data = decode_stream(stream)
+            first = stream.attrs['First']
+            header = Lexer(data[:first])
+            offsets = []
+            for _ in range(stream.attrs['N']):
+                header.token()
+                offsets.append(int(header.token()))
+            self.object_streams[num] = (data, first, offsets)
+        return self.object_streams[num]
+
+    def get_object(self, num):
+        entry = self.xref.get(num)
+        if entry is None:
+            return None
+        if entry[0] == 'n':
+            return self.read_object_at(entry[1])
+        data, first, offsets = self.object_stream(entry[1])
+        return Lexer(data, first + offsets[entry[2]]).parse()
+
+    def resolve(self, value, depth=0):
+        while isinstance(value, Ref):
+            if depth > 32:
+                raise PDFError('циклические ссылки')
+            value = self.get_object(value.num)
+            depth += 1
+        return value
+
+
+def decode_text(value):
+    if not isinstance(value, bytes):
+        return None
+    if value.startswith(b'\xfe\xff'):
+        return value[2:].decode('utf-16-be', 'replace').strip('\x00').strip() or None
+    if value.startswith(b'\xef\xbb\xbf'):
+        return value[3:].decode('utf-8', 'replace').strip() or None
+    return value.decode('latin-1').strip() or None
+
+
+def scan_page_count(file):
+    # запасной путь для файлов с битым xref: ищем /Type /Pages ... /Count потоково
+    file.seek(0)
+    count = None
+    tail = b''
+    while True:
+        block = file.read(READ_SIZE)
+        if not block:
+            return count
+        data = tail + block
+        for match in PAGES_COUNT_RE.finditer(data):
+            value = int(match.group(1) or match.group(2))
+            count = value if count is None else max(count, value)
+        tail = data[-SCAN_OVERLAP:]
+
+
+def has_pdf_header(file):
+    # дешёвая проверка прямо в запросе; полный разбор — в фоне
+    position = file.tell()
+    head = file.read(1024)
+    file.seek(position)
+    return b'%PDF-' in head
+
+
+def read_metadata(path):
+    """
+    Возвращает {'pages', 'version', 'title', 'author', 'creation_date', 'year', 'encrypted', 'recovered'}.
+
+    PDFError — файл не PDF или разобрать его не удалось.
+    """
+    with open(path, 'rb') as file:
+        reader = PDFReader(file)
+        version = reader.header_version()
+        try:
+            reader.load_xref()
+            root = reader.resolve(reader.trailer.get('Root'))
+            pages = reader.resolve(root.get('Pages')) if isinstance(root, dict) else None
+            count = reader.resolve(pages.get('Count')) if isinstance(pages, dict) else None
+            if not isinstance(count, int):
+                raise PDFError('в каталоге нет /Pages /Count')
+        except (PDFError, KeyError, IndexError, TypeError, ValueError, zlib.error):
+            count = scan_page_count(file)
+            if count is None:
+                raise PDFError('не удалось восстановить структуру файла')
+            return {'pages': count, 'version': version, 'recovered': True}
+
+        metadata = {'pages': count, 'version': version, 'encrypted': 'Encrypt' in reader.trailer}
+        info = None
+        if not metadata['encrypted']:
+            try:
+                info = reader.resolve(reader.trailer.get('Info'))
+            except (PDFError, KeyError, IndexError, TypeError, ValueError, zlib.error):
+                info = None
+        if isinstance(info, dict):
+            metadata['title'] = decode_text(info.get('Title'))
+            metadata['author'] = decode_text(info.get('Author'))
+            created = decode_text(info.get('CreationDate'))
+            metadata['creation_date'] = created
+            match = DATE_RE.match(created or '')
+            if match and 1900 <= int(match.group(1)) <= 2100:
+                metadata['year'] = int(match.group(1))
+        return metadata
@@ -0,0 +1,121 @@
+import random
+import threading
+import time
+
+from django.core.cache import cache
+
+from .cache import bump
+
+GENERATION_KEY = 'book_ids:gen'
+# страховка от bulk_create/queryset.delete(), которые не шлют сигналы
+MAX_AGE = 60 * 10
+
+
+class IdPool:
+    # список + индекс позиций: add/discard/sample за O(1)/O(k)
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+
+    def add(self, pk):
+        if pk not in self.positions:
+            self.positions[pk] = len(self.ids)
+            self.ids.append(pk)
+
+    def discard(self, pk):
+        position = self.positions.pop(pk, None)
+        if position is None:
+            return
+        last = self.ids.pop()
+        if position < len(self.ids):
+            self.ids[position] = last
+            self.positions[last] = position
+
+    def sample(self, k):
+        return random.sample(self.ids, min(k, len(self.ids)))
+
+
+class BookSampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.built_at = 0
+        self.facets = {}
+        self.pools = {}
+
+    def _pool(self, key):
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = IdPool()
+        return pool
+
+    def _keys(self, direction_id, genre_id):
+        keys = [('all', None), ('direction', direction_id)]
+        if genre_id is not None:
+            keys.append(('genre', genre_id))
+        return keys
+
+    def _add(self, pk, direction_id, genre_id):
+        self.facets[pk] = (direction_id, genre_id)
+        for key in self._keys(direction_id, genre_id):
+            self._pool(key).add(pk)
+
+    def _discard(self, pk):
+        facets = self.facets.pop(pk, None)
+        if facets is None:
+            return
+        for key in self._keys(*facets):
+            self._pool(key).discard(pk)
+
+    def _rebuild(self, generation):
+        from .models import Book
+        self.facets = {}
+        self.pools = {}
+        for pk, direction_id, genre_id in Book.objects.values_list('id', 'direction_id', 'genre_id').iterator():
+            self._add(pk, direction_id, genre_id)
+        self.generation = generation
+        self.built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        generation = cache.get_or_set(GENERATION_KEY, 1, timeout=None)
+        if generation != self.generation or time.monotonic() - self.built_at > MAX_AGE:
+            self._rebuild(generation)
+
+    def _bump(self):
+        generation = bump(GENERATION_KEY)
+        # если между нашими изменениями писал другой воркер — пересоберёмся при чтении
+        if self.generation is not None and generation == self.generation + 1:
+            self.generation = generation
+        else:
+            self.generation = None
+
+    def sample(self, k, direction=None, genre=None):
+        with self.lock:
+            self._ensure_fresh()
+            if genre is not None and direction is not None:
+                pool = self.pools.get(('genre', genre))
+                ids = [pk for pk in pool.ids if self.facets[pk][0] == direction] if pool else []
+                return random.sample(ids, min(k, len(ids)))
+            if genre is not None:
+                pool = self.pools.get(('genre', genre))
+            elif direction is not None:
+                pool = self.pools.get(('direction', direction))
+            else:
+                pool = self.pools.get(('all', None))
+            return pool.sample(k) if pool else []
+
+    def book_saved(self, book):
+        with self.lock:
+            if self.facets.get(book.pk) == (book.direction_id, book.genre_id):
+                return
+            self._discard(book.pk)
+            self._add(book.pk, book.direction_id, book.genre_id)
+            self._bump()
+
+    def book_deleted(self, book):
+        with self.lock:
+            self._discard(book.pk)
+            self._bump()
+
+
+sampler = BookSampler()
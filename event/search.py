@@ -0,0 +1,103 @@
+import re
+
+from django.db import connection
+
+from .models import Book
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# веса bm25 для колонок title, author, description
+WEIGHTS = (10.0, 5.0, 1.0)
+HIGHLIGHT = ('<mark>', '</mark>')
+
+
+def build_match(query):
+    # пользовательский ввод не пускаем в синтаксис FTS5: только слова в кавычках,
+    # последнее — префиксом, чтобы «прогр» находило «программирование»
+    words = WORD_RE.findall(query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_books(query, limit, offset=0):
+    # [(book_id, rank, title_snippet, description_snippet), ...] по убыванию релевантности
+    match = build_match(query)
+    if match is None:
+        return []
+    if connection.vendor != 'sqlite':
+        queryset = Book.objects.filter(title__icontains=query) | Book.objects.filter(author__icontains=query)
+        ids = queryset.order_by('id').values_list('id', flat=True)[offset:offset + limit]
+        return [(pk, None, None, None) for pk in ids]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT rowid,
+                   bm25(event_book_fts, %s, %s, %s) AS rank,
+                   snippet(event_book_fts, 0, %s, %s, '…', 12),
+                   snippet(event_book_fts, 2, %s, %s, '…', 24)
+            FROM event_book_fts
+            WHERE event_book_fts MATCH %s
+            ORDER BY rank
+            LIMIT %s OFFSET %s
+            """,
+            [*WEIGHTS, *HIGHLIGHT, *HIGHLIGHT, match, limit, offset],
+        )
+        return cursor.fetchall()
+
+
+# те же триггеры, что в миграции 0002: SQLite теряет их при пересоздании
+# event_book (любой AlterField на Book), поэтому восстанавливаем после migrate
+TRIGGERS_SQL = {
+    'event_book_fts_ai': """
+        CREATE TRIGGER IF NOT EXISTS event_book_fts_ai AFTER INSERT ON event_book BEGIN
+            INSERT INTO event_book_fts(rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    """,
+    'event_book_fts_ad': """
+        CREATE TRIGGER IF NOT EXISTS event_book_fts_ad AFTER DELETE ON event_book BEGIN
+            INSERT INTO event_book_fts(event_book_fts, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+        END
+    """,
+    'event_book_fts_au': """
+        CREATE TRIGGER IF NOT EXISTS event_book_fts_au AFTER UPDATE OF title, author, description ON event_book BEGIN
+            INSERT INTO event_book_fts(event_book_fts, rowid, title, author, description)
+            VALUES ('delete', old.id, old.title, old.author, old.description);
+            INSERT INTO event_book_fts(rowid, title, author, description)
+            VALUES (new.id, new.title, new.author, new.description);
+        END
+    """,
+}
+
+
+def ensure_triggers(using='default', **kwargs):
+    # обработчик post_migrate
+    from django.db import connections
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'event_book_fts'")
+        if cursor.fetchone() is None:
+            return
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'event_book_fts_%'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name in TRIGGERS_SQL if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS_SQL[name])
+        if missing:
+            # пока триггеров не было, индекс мог разойтись с таблицей
+            cursor.execute("INSERT INTO event_book_fts(event_book_fts) VALUES ('rebuild')")
+
+
+def rebuild_index():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO event_book_fts(event_book_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO event_book_fts(event_book_fts) VALUES ('optimize')")
+    return True
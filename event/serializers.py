@@ -11,32 +11,67 @@ class BookSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Book
-        fields = '__all__'
+        exclude = ('image1_variants', 'pdf_metadata', 'pdf_status')
 
 class NewsSerializer(serializers.ModelSerializer):
     class Meta:
         model = News
-        fields = '__all__'
+        exclude = ('image1_variants', )
+
+    def to_representation(self, instance):
+        rep = super().to_representation(instance)
+        rep['srcset'] = instance.get_srcset()
+        return rep
 
 
 
 class BookListSerializer(serializers.ModelSerializer):
+    # ?view=card — то, что нужно карточке в каталоге, без comments/stats
+    CARD_FIELDS = ('id', 'title', 'author', 'year', 'images', 'srcset', 'genres',
+                   'direction_name', 'total_views', 'total_down')
 
     class Meta:
         model = Book
-        fields = '__all__'
+        exclude = ('image1_variants', 'pdf_metadata', 'pdf_status')
+
+    def __init__(self, *args, **kwargs):
+        # fields=None — полное представление, как раньше
+        requested = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        self.requested = set(requested) if requested else None
+        if self.requested is not None:
+            for name in set(self.fields) - self.requested:
+                self.fields.pop(name)
+
+    def wants(self, key):
+        return self.requested is None or key in self.requested
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['images'] = instance.get_image_url(f"image1")
-        rep['genres'] = BookGenreSerializer(instance.genre).data
-        rep['pdf'] = instance.get_pdf_url()
-        rep['direction_name'] = DirectionSerializer(instance.direction).data
-        rep['comments'] = CommentSerializer(instance.comments, many=True).data
-        rep['stats'] = ViewsStatsSerializer(instance.view_stats, many=True).data
-        rep['total_views'] = instance.view_stats.filter(v_count=True).count()
-        rep['total_down'] = instance.view_stats.filter(d_count=True).count()
-        if instance.author_account:
+        if self.wants('images'):
+            rep['images'] = instance.get_image_url(f"image1")
+        if self.wants('srcset'):
+            rep['srcset'] = instance.get_srcset()
+        if self.wants('genres'):
+            rep['genres'] = BookGenreSerializer(instance.genre).data
+        if self.wants('pdf'):
+            rep['pdf'] = instance.get_pdf_url()
+        if self.wants('direction_name'):
+            rep['direction_name'] = DirectionSerializer(instance.direction).data
+        if self.wants('comments'):
+            rep['comments'] = CommentSerializer(instance.comments, many=True).data
+        if self.wants('stats'):
+            rep['stats'] = ViewsStatsSerializer(instance.view_stats, many=True).data
+        # total_views/total_down — из BookCounters (select_related в Book.objects.for_listing())
+        if self.wants('total_views') or self.wants('total_down'):
+            counters = getattr(instance, 'counters', None)
+            if self.wants('total_views'):
+                rep['total_views'] = counters.views if counters else \
+                    instance.view_stats.filter(v_count=True).count()
+            if self.wants('total_down'):
+                rep['total_down'] = counters.downloads if counters else \
+                    instance.view_stats.filter(d_count=True).count()
+        if self.wants('author_account') and instance.author_account:
             rep['author_account'] = {
                 'name': instance.author_account.full_name,
                 'id': instance.author_account.id
@@ -60,14 +95,20 @@ class ViewsStatsSerializer(serializers.ModelSerializer):
 
 
 class DirectionStatsSerializer(serializers.ModelSerializer):
-    books_count = serializers.SerializerMethodField()
+    # поля — аннотации из event/aggregates.py
+    books_count = serializers.IntegerField(read_only=True)
+    views = serializers.IntegerField(read_only=True)
+    downloads = serializers.IntegerField(read_only=True)
+    favorites = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = BookDirection
-        fields = ('id', 'name', 'books_count')
+        fields = ('id', 'name', 'books_count', 'views', 'downloads', 'favorites')
 
-    def get_books_count(self, obj):
-        return obj.books.count()
+
+class GenreStatsSerializer(DirectionStatsSerializer):
+    class Meta(DirectionStatsSerializer.Meta):
+        model = Genre
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -77,7 +118,7 @@ class CommentSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         rep = super().to_representation(instance)
-        rep['book'] = instance.book.id
+        rep['book'] = instance.book_id
         rep['user_id'] = instance.user.id
         rep['name'] = instance.user.full_name
         rep['phone'] = instance.user.phone_number
@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate
+from .counters import add_counts
+from .models import Book, BookCounters, BookDirection, Comment, Favorite, Genre, News, ViewsStats
+from .sampler import sampler
+from .autocomplete import prefix_index
+from .storage import release
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_book_cache(sender, instance, **kwargs):
+    invalidate('books', 'stats')
+
+
+@receiver(post_save, sender=Book)
+def update_book_indexes_on_save(sender, instance, **kwargs):
+    sampler.book_saved(instance)
+    prefix_index.book_saved(instance)
+
+
+@receiver(post_delete, sender=Book)
+def update_book_indexes_on_delete(sender, instance, **kwargs):
+    sampler.book_deleted(instance)
+    prefix_index.book_deleted(instance)
+
+
+@receiver(post_save, sender=Book)
+def create_book_counters(sender, instance, created, **kwargs):
+    if created:
+        BookCounters.objects.get_or_create(book_id=instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Favorite)
+def count_added(sender, instance, created, **kwargs):
+    if created:
+        add_counts({instance.book_id: {COUNTER_NAMES[sender]: 1}})
+
+
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Favorite)
+def count_removed(sender, instance, **kwargs):
+    add_counts({instance.book_id: {COUNTER_NAMES[sender]: -1}})
+
+
+COUNTER_NAMES = {Comment: 'comments', Favorite: 'favorites'}
+
+
+# буфер просмотров пишет ViewsStats через bulk_create и сам правит счётчики;
+# сюда попадают только правки поштучно (админка, каскадное удаление)
+@receiver(pre_save, sender=ViewsStats)
+def remember_old_flags(sender, instance, **kwargs):
+    old = sender.objects.filter(pk=instance.pk).values_list('v_count', 'd_count').first() if instance.pk else None
+    instance._old_flags = old or (False, False)
+
+
+@receiver(post_save, sender=ViewsStats)
+def count_flags_saved(sender, instance, **kwargs):
+    old_views, old_downs = getattr(instance, '_old_flags', (False, False))
+    add_counts({instance.book_id: {'views': instance.v_count - old_views,
+                                   'downloads': instance.d_count - old_downs}})
+
+
+@receiver(post_delete, sender=ViewsStats)
+def count_flags_deleted(sender, instance, **kwargs):
+    add_counts({instance.book_id: {'views': -instance.v_count, 'downloads': -instance.d_count}})
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def invalidate_book_related_cache(sender, instance, **kwargs):
+    invalidate('books')
+
+
+@receiver([post_save, post_delete], sender=ViewsStats)
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_counted_cache(sender, instance, **kwargs):
+    invalidate('books', 'stats')
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+def invalidate_favorite_cache(sender, instance, **kwargs):
+    invalidate('stats')
+
+
+@receiver([post_save, post_delete], sender=BookDirection)
+def invalidate_direction_cache(sender, instance, **kwargs):
+    invalidate('books', 'stats')
+
+
+@receiver([post_save, post_delete], sender=News)
+def invalidate_news_cache(sender, instance, **kwargs):
+    invalidate('news')
+
+
+def release_files(names):
+    # после коммита: если транзакция откатится, файлы должны остаться на месте
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: [release(name) for name in names])
+
+
+@receiver(pre_save, sender=Book)
+@receiver(pre_save, sender=News)
+def remember_old_files(sender, instance, **kwargs):
+    if not instance.pk:
+        return
+    fields = ['pdf', 'image1'] if sender is Book else ['image1']
+    instance._old_files = sender.objects.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=News)
+def release_replaced_files(sender, instance, **kwargs):
+    old_files = getattr(instance, '_old_files', {})
+    release_files([name for field, name in old_files.items() if name != getattr(instance, field).name])
+
+
+@receiver(post_delete, sender=Book)
+def release_book_files(sender, instance, **kwargs):
+    release_files([instance.pdf.name, instance.image1.name])
+
+
+@receiver(post_delete, sender=News)
+def release_news_files(sender, instance, **kwargs):
+    release_files([instance.image1.name])
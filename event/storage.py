@@ -0,0 +1,85 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+READ_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for data in iter(lambda: file.read(READ_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # один файл на SHA-256: blobs/ab/cd/<sha256>.<ext>; одинаковые загрузки
+    # получают одно и то же имя, а файл на диске лежит в одном экземпляре
+    prefix = 'blobs'
+
+    def blob_name(self, sha256, name):
+        ext = os.path.splitext(name)[1].lower()
+        return f'{self.prefix}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}'
+
+    def get_available_name(self, name, max_length=None):
+        # имя определяется содержимым, занятость имени — это и есть дедупликация
+        return name
+
+    def _save(self, name, content):
+        # хэшируем по ходу записи во временный файл рядом с blobs/
+        directory = self.path(self.prefix)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=directory, suffix='.part', delete=False) as tmp:
+            for chunk in content.chunks():
+                digest.update(chunk)
+                tmp.write(chunk)
+        return self._store(tmp.name, digest.hexdigest(), name)
+
+    def adopt(self, path, name, sha256=None):
+        # забирает уже лежащий на этой же ФС файл (rename, без копирования)
+        return self._store(path, sha256 or file_sha256(path), name)
+
+    def _store(self, tmp_path, sha256, name):
+        blob = self.blob_name(sha256, name)
+        full_path = self.path(blob)
+        if os.path.exists(full_path):
+            os.remove(tmp_path)
+            return blob
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        os.replace(tmp_path, full_path)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return blob
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
+
+
+def reference_count(name):
+    # сколько строк ссылаются на файл; считаем по самим таблицам, поэтому
+    # счётчик не расходится при bulk-операциях и ручных правках
+    from .models import Book, News
+    if not name:
+        return 0
+    return Book.objects.filter(pdf=name).count() + \
+        Book.objects.filter(image1=name).count() + \
+        News.objects.filter(image1=name).count()
+
+
+def release(name):
+    # удаляет blob и его превью (<sha256>_<width>.<fmt>), если на него больше никто не ссылается
+    if name and name.startswith(f'{ContentAddressedStorage.prefix}/') and not reference_count(name):
+        content_storage.delete(name)
+        for path in glob.glob(f'{os.path.splitext(content_storage.path(name))[0]}_*'):
+            os.remove(path)
@@ -0,0 +1,36 @@
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+def iter_json_array(queryset, serialize, chunk_size=500):
+    # iterator(chunk_size) делает prefetch_related по каждому куску,
+    # поэтому в памяти одновременно не больше chunk_size объектов
+    renderer = JSONRenderer()
+    yield b'['
+    first = True
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        data = renderer.render(serialize(obj))
+        yield data if first else b',' + data
+        first = False
+    yield b']'
+
+
+def streaming_json_response(queryset, serialize, chunk_size=500):
+    return StreamingHttpResponse(
+        iter_json_array(queryset, serialize, chunk_size),
+        content_type='application/json',
+    )
+
+
+def iter_json_lines(queryset, serialize, chunk_size=500):
+    # JSON Lines: по объекту на строку, клиент может разбирать по мере получения
+    renderer = JSONRenderer()
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        yield renderer.render(serialize(obj)) + b'\n'
+
+
+def streaming_json_lines_response(queryset, serialize, chunk_size=500):
+    return StreamingHttpResponse(
+        iter_json_lines(queryset, serialize, chunk_size),
+        content_type='application/x-ndjson',
+    )
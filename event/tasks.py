@@ -1,20 +1,60 @@
-from datetime import datetime
-import pytz
-from celery import shared_task
-from .models import TenderDate
 import logging
+
+from celery import shared_task
+from django.apps import apps
+
+from .cache import invalidate
+from .models import Book
+from .pdfmeta import PDFError, read_metadata
+from .thumbnails import render_variants, variants_for
+
+logger = logging.getLogger(__name__)
+
+
 @shared_task
-def check_event_dates():
-    logging.info("Executing Task")
-    # Get the current time in Asia/Bishkek timezone
-    tz = pytz.timezone('Asia/Bishkek')
-    now = datetime.now(tz)
+def generate_thumbnails(model_label, pk):
+    model = apps.get_model(model_label)
+    obj = model.objects.filter(pk=pk).only('id', 'image1').first()
+    if obj is None or not obj.image1:
+        return
+    name = obj.image1.name
+    try:
+        rendered = render_variants(obj.image1.path)
+    except (OSError, ValueError) as error:
+        logger.warning('Не удалось сделать превью %s #%s (%s): %s', model_label, pk, name, error)
+        return
+    # update(), а не save(): не трогаем остальные поля и сигналы файлов;
+    # если обложку успели заменить, старые превью не записываем
+    model.objects.filter(pk=pk, image1=name).update(image1_variants=variants_for(name, rendered))
+    invalidate('news' if model_label == 'event.News' else 'books')
+
+
+def save_pdf_metadata(book, metadata):
+    # pages, введённые вручную, не перетираем. Год из /CreationDate — это дата
+    # создания файла, а не издания: он остаётся только в pdf_metadata
+    fields = {'pdf_status': 'ok', 'pdf_metadata': metadata}
+    if not book.pages and metadata.get('pages'):
+        fields['pages'] = metadata['pages']
+    # если PDF успели заменить, результат уже не про него
+    Book.objects.filter(pk=book.pk, pdf=book.pdf.name).update(**fields)
 
-    # Find all EventDate objects where date_time is in the past and status is False
-    expired_dates = TenderDate.objects.filter(date_time__lt=now, status=False)
 
-    # Update the status of all expired dates to True
-    expired_dates.update(status=False)
+def mark_pdf_corrupt(book, error):
+    Book.objects.filter(pk=book.pk, pdf=book.pdf.name).update(
+        pdf_status='corrupt', pdf_metadata={'error': str(error)}
+    )
 
-    # Log a message to confirm that the task has run
-    print(f"Checked {expired_dates.count()} expired event dates.")
+
+@shared_task
+def extract_pdf_metadata(book_id):
+    book = Book.objects.filter(pk=book_id).only('id', 'pdf', 'pages').first()
+    if book is None or not book.pdf:
+        return
+    try:
+        metadata = read_metadata(book.pdf.path)
+    except (PDFError, OSError) as error:
+        logger.warning('Не удалось разобрать PDF книги #%s (%s): %s', book_id, book.pdf.name, error)
+        mark_pdf_corrupt(book, error)
+    else:
+        save_pdf_metadata(book, metadata)
+    invalidate('books')
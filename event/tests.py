@@ -1,3 +1,1181 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from account.models import Group
+from account.testing import make_user
+from .autocomplete import normalize, prefix_index
+from .aggregates import REFRESH_INTERVAL
+from .cache import KEY_PREFIX, bump, release_lock
+from .counters import StatsBuffer, rebuild_counters, stats_buffer
+from .duplicates import DisjointSet, delete_duplicates, exact_clusters, near_clusters
+from .serializers import BookListSerializer
+from .pdfmeta import PDFError, has_pdf_header, read_metadata
+from .tasks import generate_thumbnails, save_pdf_metadata
+from .thumbnails import render_variants, variant_name
+from .models import Book, BookCounters, BookDirection, Comment, Favorite, Genre, News, UploadSession, ViewsStats
+from .sampler import GENERATION_KEY, IdPool, sampler
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, UPLOAD_TEMP_DIR=f'{MEDIA_ROOT}/uploads/tmp',
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogTestCase(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        # индексы в памяти воркера переживают откат транзакции теста
+        sampler.generation = prefix_index.generation = None
+        self.client = APIClient()
+        self.group = Group.objects.create(name='ИТ-1', course=1)
+        self.teacher = make_user('teacher@example.com', user_type='teacher', is_staff=True)
+        self.students = [make_user(f's{i}@example.com', group=self.group) for i in range(3)]
+        self.direction = BookDirection.objects.create(name='ИТ')
+        self.genre = Genre.objects.create(name='Учебник')
+
+    def make_book(self, title='Книга', author='Автор', **fields):
+        fields = {'description': 'Описание', 'genre': self.genre, 'direction': self.direction, 'year': 2020,
+                  'pages': 100, 'author_account': self.teacher, **fields}
+        book = Book(title=title, author=author, **fields)
+        # содержимое у каждой книги своё: одинаковые файлы — тоже дубликаты
+        content = f'%PDF-1.4\n{title} {Book.objects.count()}'.encode()
+        book.pdf.save('book.pdf', ContentFile(content), save=False)
+        book.save()
+        return book
+
+    def make_books(self, count):
+        books = []
+        for i in range(count):
+            book = self.make_book(title=f'Книга {Book.objects.count()}')
+            for student in self.students:
+                ViewsStats.objects.create(user=student, book=book, v_count=True, d_count=True)
+                Comment.objects.create(user=student, book=book, text='Комментарий')
+                Favorite.objects.create(user=student, book=book)
+            books.append(book)
+        return books
+
+
+class BookQueriesTest(CatalogTestCase):
+    # число запросов не должно расти вместе с числом книг (N+1):
+    # книги со счётчиками — один JOIN, комментарии и просмотры — по prefetch
+    def assertQueriesDoNotGrow(self, url, queries):
+        self.make_books(3)
+        with self.assertNumQueries(queries):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.make_books(6)
+        cache.clear()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        response = self.assertQueriesDoNotGrow('/api/v1/books/', 3)
+        self.assertEqual(len(response.data), 9)
+        self.assertEqual(response.data[0]['total_views'], 3)
+
+    def test_detail(self):
+        book = self.make_books(1)[0]
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/v1/books/{book.id}/')
+        self.assertEqual(response.data['total_down'], 3)
+        self.assertEqual(len(response.data['comments']), 3)
+
+
+
+class SparseFieldsTest(CatalogTestCase):
+    # порядок ключей полного ответа — как до sparse fieldsets (DRF ставит FK после
+    # обычных полей), плюс srcset
+    DETAIL_KEYS = ['id', 'author', 'title', 'description', 'pages', 'year', 'pdf', 'image1',
+                   'author_account', 'genre', 'direction', 'images', 'srcset', 'genres', 'direction_name',
+                   'comments', 'stats', 'total_views', 'total_down']
+
+    def test_card(self):
+        self.make_books(3)
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/v1/books/?view=card').data
+        self.assertEqual(set(data[0]), set(BookListSerializer.CARD_FIELDS))
+
+    def test_fields(self):
+        book = self.make_books(1)[0]
+        data = self.client.get(f'/api/v1/books/{book.id}/?fields=id,title,total_views').data
+        self.assertEqual(data, {'id': book.id, 'title': book.title, 'total_views': 3})
+
+    def test_detail_matches_original_payload(self):
+        book = self.make_books(1)[0]
+        image = io.BytesIO()
+        Image.new('RGB', (4, 4)).save(image, 'PNG')
+        book.image1.save('cover.png', ContentFile(image.getvalue()))
+        cache.clear()
+        data = json.loads(self.client.get(f'/api/v1/books/{book.id}/').content)
+        self.assertEqual(list(data), self.DETAIL_KEYS)
+        self.assertEqual(data['image1'], book.image1.url)
+        self.assertEqual(data['images'], f'{settings.LINK}{book.image1.url}')
+        self.assertEqual(data['pdf'], f'{settings.LINK}{book.pdf.url}')
+        self.assertEqual(data['author_account'], {'name': self.teacher.full_name, 'id': self.teacher.id})
+        self.assertEqual((data['genres'], data['direction_name']),
+                         ({'name': 'Учебник'}, {'id': self.direction.id, 'name': 'ИТ', 'description': None}))
+        self.assertEqual(list(data['comments'][0]), ['id', 'text', 'book', 'user_id', 'name', 'phone'])
+
+
+class KeysetPaginationTest(CatalogTestCase):
+    def test_pages_walk_whole_catalog(self):
+        books = self.make_books(7)
+        ids, url = [], '/api/v1/books/?limit=3'
+        while url:
+            with self.assertNumQueries(3):
+                data = self.client.get(url).data
+            ids += [row['id'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [book.id for book in books])
+
+    def test_without_cursor_returns_plain_list(self):
+        self.make_books(2)
+        self.assertIsInstance(self.client.get('/api/v1/books/').data, list)
+
+
+class StreamingTest(CatalogTestCase):
+    def test_stream_matches_plain_list(self):
+        self.make_books(4)
+        plain = self.client.get('/api/v1/books/')
+        streamed = self.client.get('/api/v1/books/?stream=1')
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(json.loads(b''.join(streamed.streaming_content)), json.loads(plain.content))
+
+    def test_empty_catalog(self):
+        streamed = self.client.get('/api/v1/books/?stream=1')
+        self.assertEqual(b''.join(streamed.streaming_content), b'[]')
+
+
+
+
+class ResponseCacheTest(CatalogTestCase):
+    def get(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_list_is_cached_until_catalog_changes(self):
+        book = self.make_books(2)[0]
+        self.get('/api/v1/books/', 3)
+        self.get('/api/v1/books/', 0)
+        # другой query string — другой ключ
+        self.get('/api/v1/books/?view=card', 1)
+        book.title = 'Новое название'
+        book.save()
+        self.assertEqual(self.get('/api/v1/books/', 3)[0]['title'], 'Новое название')
+
+    def test_flush_invalidates_only_touched_books(self):
+        first, second = self.make_books(2)
+        reader = make_user('reader@example.com', group=self.group)
+        for book in (first, second):
+            self.get(f'/api/v1/books/{book.id}/', 3)
+        self.get('/api/v1/books/', 3)
+
+        stats_buffer.record(reader.id, first.id, view=True)
+        stats_buffer.flush()
+        self.assertEqual(self.get(f'/api/v1/books/{first.id}/', 3)['total_views'], 4)
+        self.get(f'/api/v1/books/{second.id}/', 0)
+        # список целиком сбросом счётчиков не выметается
+        self.get('/api/v1/books/', 0)
+
+
+
+class SamplerTest(CatalogTestCase):
+    def ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [book['id'] for book in response.data]
+
+    def test_id_pool(self):
+        pool = IdPool()
+        for pk in range(10):
+            pool.add(pk)
+        pool.add(3)
+        pool.discard(3)
+        pool.discard(9)
+        pool.discard(100)
+        self.assertEqual(sorted(pool.ids), [0, 1, 2, 4, 5, 6, 7, 8])
+        self.assertEqual({pk: pool.ids[position] for pk, position in pool.positions.items()},
+                         {pk: pk for pk in pool.ids})
+        self.assertEqual(len(set(pool.sample(5))), 5)
+        self.assertEqual(sorted(pool.sample(50)), sorted(pool.ids))
+
+    def test_random_without_order_by_random(self):
+        books = [self.make_book(title=f'Книга {i}') for i in range(10)]
+        with CaptureQueriesContext(connection) as queries:
+            ids = self.ids('/api/v1/books/random/')
+        self.assertEqual(len(set(ids)), 6)
+        self.assertTrue(set(ids) <= {book.id for book in books})
+        for query in queries:
+            self.assertNotIn('RANDOM', query['sql'].upper())
+
+    def test_facets(self):
+        other_direction = BookDirection.objects.create(name='Экономика')
+        other_genre = Genre.objects.create(name='Задачник')
+        for i in range(4):
+            self.make_book(title=f'Книга {i}')
+        economics = {self.make_book(title=f'Экономика {i}', direction=other_direction).id for i in range(2)}
+        tasks = {self.make_book(title=f'Задачи {i}', genre=other_genre).id for i in range(3)}
+        both = self.make_book(title='Задачи по экономике', direction=other_direction, genre=other_genre).id
+
+        self.assertEqual(set(self.ids(f'/api/v1/books/random/?direction={other_direction.id}')), economics | {both})
+        self.assertEqual(set(self.ids(f'/api/v1/books/random/?genre={other_genre.id}')), tasks | {both})
+        self.assertEqual(self.ids(f'/api/v1/books/random/?direction={other_direction.id}&genre={other_genre.id}'),
+                         [both])
+        self.assertEqual(self.ids('/api/v1/books/random/?genre=100500'), [])
+        self.assertEqual(self.client.get('/api/v1/books/random/?direction=abc').status_code, 400)
+
+    def test_pool_follows_saves_and_deletes(self):
+        kept = self.make_book(title='Остаётся')
+        moved = self.make_book(title='Переезжает')
+        removed = self.make_book(title='Удаляется')
+        self.ids('/api/v1/books/random/')
+
+        other_direction = BookDirection.objects.create(name='Экономика')
+        moved.direction = other_direction
+        moved.save()
+        removed.delete()
+        self.assertEqual(sorted(self.ids('/api/v1/books/random/')), sorted([kept.id, moved.id]))
+        self.assertEqual(self.ids(f'/api/v1/books/random/?direction={other_direction.id}'), [moved.id])
+
+    def test_rebuild_after_bulk_changes(self):
+        # bulk_create сигналов не шлёт: пул пересобирается, когда поколение
+        # сдвинул кто-то другой (другой воркер, команда)
+        self.make_book(title='Первая')
+        self.ids('/api/v1/books/random/')
+        Book.objects.bulk_create([Book(title='Вторая', author='Автор', description='', genre=self.genre,
+                                       direction=self.direction, year=2020, pages=1)])
+        self.assertEqual(len(self.ids('/api/v1/books/random/')), 1)
+        bump(GENERATION_KEY)
+        self.assertEqual(len(self.ids('/api/v1/books/random/')), 2)
+
+
+
+class SearchTest(CatalogTestCase):
+    def search(self, query, **params):
+        response = self.client.get('/api/v1/books/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranked_by_column_weights(self):
+        in_description = self.make_book(title='Сборник', description='Основы программирования на Python')
+        in_title = self.make_book(title='Программирование на Python')
+        self.make_book(title='История', description='Древний мир')
+
+        results = self.search('python')['results']
+        self.assertEqual([book['id'] for book in results], [in_title.id, in_description.id])
+        self.assertLess(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(results[0]['highlight']['title'], 'Программирование на <mark>Python</mark>')
+        self.assertIn('<mark>Python</mark>', results[1]['highlight']['description'])
+
+    def test_prefix_and_case(self):
+        book = self.make_book(title='Программирование', author='Иванов')
+        self.assertEqual([hit['id'] for hit in self.search('ПРОГР')['results']], [book.id])
+        self.assertEqual([hit['id'] for hit in self.search('иванов прогр')['results']], [book.id])
+        self.assertEqual(self.search('программы')['results'], [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.make_book(title='Книга')
+        for query in ['"', 'NEAR(книга', 'книга OR', '*', 'title:книга', '']:
+            self.search(query)
+
+    def test_index_follows_changes(self):
+        book = self.make_book(title='Алгебра')
+        book.title = 'Геометрия'
+        book.save()
+        self.assertEqual(self.search('алгебра')['results'], [])
+        self.assertEqual([hit['id'] for hit in self.search('геометрия')['results']], [book.id])
+        book.delete()
+        self.assertEqual(self.search('геометрия')['results'], [])
+
+    def test_pagination(self):
+        ids = [self.make_book(title=f'Физика {i}').id for i in range(3)]
+        first = self.search('физика', page_size=2)
+        self.assertEqual(len(first['results']), 2)
+        self.assertIn('page=2', first['next'])
+        second = self.client.get(first['next']).data
+        self.assertIsNone(second['next'])
+        self.assertEqual(sorted(hit['id'] for hit in first['results'] + second['results']), sorted(ids))
+        self.assertEqual(self.client.get('/api/v1/books/search/?q=физика&page=x').status_code, 400)
+
+    def test_rebuild_command(self):
+        book = self.make_book(title='Химия')
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO event_book_fts(event_book_fts) VALUES ('delete-all')")
+        self.assertEqual(self.search('химия')['results'], [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual([hit['id'] for hit in self.search('химия')['results']], [book.id])
+
+
+
+class AutocompleteTest(CatalogTestCase):
+    def suggest(self, query, **params):
+        response = self.client.get('/api/v1/books/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Ёжик в  ТУМАНЕ!'), 'ежик в тумане')
+        self.assertEqual(normalize(None), '')
+
+    def test_prefixes_of_title_words_and_author(self):
+        book = self.make_book(title='Теория вероятностей', author='Гмурман')
+        self.assertEqual(self.suggest('теор'), [book.id])
+        self.assertEqual(self.suggest('вероятн'), [book.id])
+        self.assertEqual(self.suggest('ГМУР'), [book.id])
+        self.assertEqual(self.suggest('еория'), [])
+        self.assertEqual(self.suggest(''), [])
+
+    def test_whole_title_before_word_suffix(self):
+        inner = self.make_book(title='Задачи по физике', author='Иванов')
+        whole = self.make_book(title='Физика', author='Петров')
+        self.assertEqual(self.suggest('физ'), [whole.id, inner.id])
+        self.assertEqual(self.suggest('физ', limit=1), [whole.id])
+        self.assertEqual(self.client.get('/api/v1/books/autocomplete/?q=физ&limit=x').status_code, 400)
+
+    def test_no_queries_once_built(self):
+        self.make_book(title='Экономика')
+        self.suggest('эко')
+        with self.assertNumQueries(0):
+            self.suggest('эконом')
+
+    def test_index_follows_saves_and_deletes(self):
+        book = self.make_book(title='Алгебра')
+        self.suggest('алг')
+        book.title = 'Геометрия'
+        book.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('алг'), [])
+            self.assertEqual(self.suggest('геом'), [book.id])
+        book.delete()
+        self.assertEqual(self.suggest('геом'), [])
+
+
+
+class DeliveryTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = self.make_book(title='Линейная алгебра')
+        self.url = f'/api/v1/books/{self.book.id}/download/'
+        self.content = self.book.pdf.read()
+        self.book.pdf.close()
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_whole_file_by_title(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('filename*=utf-8\'\'', response['Content-Disposition'])
+
+    def test_ranges(self):
+        size = len(self.content)
+        response, body = self.get(HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[2:6])
+        self.assertEqual(response['Content-Range'], f'bytes 2-5/{size}')
+        response, body = self.get(HTTP_RANGE='bytes=-4')
+        self.assertEqual(body, self.content[-4:])
+        response, body = self.get(HTTP_RANGE=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        # несколько диапазонов не поддерживаем — файл целиком
+        response, body = self.get(HTTP_RANGE='bytes=0-1,4-5')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)[0].status_code, 206)
+        # If-Range сравнивается строго
+        self.assertEqual(self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=f'W/{etag}')[0].status_code, 200)
+
+    def test_if_none_match(self):
+        etag = self.get()[0]['ETag']
+        for header in [etag, f'W/{etag}', f'"other", {etag}', '*']:
+            response, body = self.get(HTTP_IF_NONE_MATCH=header)
+            self.assertEqual((response.status_code, body), (304, b''), header)
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"other"')[0].status_code, 200)
+
+    @override_settings(PDF_SENDFILE_HEADER='X-Accel-Redirect', PDF_ACCEL_PREFIX='/protected/')
+    def test_accel_redirect(self):
+        # старые файлы лежат под исходными именами, не хэшами
+        name = 'books/книга 1.pdf'
+        path = self.book.pdf.storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(self.content)
+        Book.objects.filter(id=self.book.id).update(pdf=name)
+        response, body = self.get()
+        self.assertEqual(body, b'')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/books/%D0%BA%D0%BD%D0%B8%D0%B3%D0%B0%201.pdf')
+
+    def test_first_chunk_counts_download(self):
+        student = self.students[0]
+        self.client.force_authenticate(student)
+        with self.settings(STATS_FLUSH_INTERVAL=0):
+            self.get(HTTP_RANGE='bytes=4-5')
+            self.assertFalse(ViewsStats.objects.filter(user=student, book=self.book).exists())
+            self.get(HTTP_RANGE='bytes=0-1')
+        self.assertTrue(ViewsStats.objects.get(user=student, book=self.book).d_count)
+
+
+
+class ChunkedUploadTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.teacher)
+        self.content = b'%PDF-1.4\n' + bytes(range(256)) * 8
+        response = self.client.post('/api/v1/books/uploads/', {
+            'filename': 'книга.pdf', 'size': len(self.content), 'chunk_size': 1024,
+        })
+        self.assertEqual(response.status_code, 201)
+        self.upload_id = response.data['id']
+
+    def put_chunk(self, index, data, checksum=None):
+        headers = {'HTTP_X_CHUNK_SHA256': checksum or hashlib.sha256(data).hexdigest()}
+        return self.client.put(f'/api/v1/books/uploads/{self.upload_id}/{index}/', data,
+                               content_type='application/octet-stream', **headers)
+
+    def put_all(self):
+        for index in range(3):
+            self.assertEqual(self.put_chunk(index, self.content[index * 1024:(index + 1) * 1024]).status_code, 200)
+
+    def missing(self):
+        return self.client.get(f'/api/v1/books/uploads/{self.upload_id}/').data['missing']
+
+    def complete(self):
+        return self.client.post(f'/api/v1/books/uploads/{self.upload_id}/complete/', {
+            'title': 'Книга', 'author': 'Автор', 'description': 'Описание', 'pages': 10, 'year': 2020,
+            'direction': self.direction.name, 'genre': self.genre.name,
+        })
+
+    def test_failed_retry_marks_chunk_missing(self):
+        first, second = self.content[:1024], self.content[1024:2048]
+        self.assertEqual(self.put_chunk(0, first).status_code, 200)
+        self.assertEqual(self.missing(), [1, 2])
+
+        # повтор с битыми байтами: кусок снова считается недополученным
+        corrupted = b'x' * 1024
+        self.assertEqual(self.put_chunk(0, corrupted, hashlib.sha256(first).hexdigest()).status_code, 400)
+        self.assertEqual(self.missing(), [0, 1, 2])
+        # обрезанный повтор — тоже
+        self.assertEqual(self.put_chunk(0, first[:100]).status_code, 400)
+        self.assertEqual(self.missing(), [0, 1, 2])
+
+        for index, data in enumerate([first, second, self.content[2048:]]):
+            self.assertEqual(self.put_chunk(index, data).status_code, 200)
+        self.assertEqual(self.missing(), [])
+        with open(UploadSession.objects.get(id=self.upload_id).temp_path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+
+    def test_complete(self):
+        self.put_chunk(0, self.content[:1024])
+        self.assertEqual(self.complete().status_code, 409)
+        self.put_all()
+        response = self.complete()
+        self.assertEqual(response.status_code, 201)
+        book = Book.objects.get(id=response.data['id'])
+        with book.pdf.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        session = UploadSession.objects.get(id=self.upload_id)
+        self.assertEqual(session.book, book)
+        self.assertFalse(os.path.exists(session.temp_path))
+        self.assertEqual(self.complete().status_code, 409)
+        self.assertEqual(self.put_chunk(0, self.content[:1024]).status_code, 409)
+
+    def test_failed_complete_can_be_retried(self):
+        self.put_all()
+        with mock.patch.object(UploadSession, 'save', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.complete()
+        session = UploadSession.objects.get(id=self.upload_id)
+        self.assertIsNone(session.book_id)
+        self.assertFalse(Book.objects.exists())
+        with open(session.temp_path, 'rb') as file:
+            self.assertEqual(file.read(), self.content)
+        # несохранённый blob не остаётся в хранилище
+        storage = Book._meta.get_field('pdf').storage
+        self.assertFalse(storage.exists(storage.blob_name(hashlib.sha256(self.content).hexdigest(), 'книга.pdf')))
+
+        response = self.complete()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UploadSession.objects.get(id=self.upload_id).book_id, response.data['id'])
+
+
+
+class ContentStorageTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = Book._meta.get_field('pdf').storage
+
+    def make_copy(self, content, title='Книга'):
+        book = Book(title=title, author='Автор', description='', genre=self.genre, direction=self.direction,
+                    year=2020, pages=1)
+        book.pdf.save('учебник.PDF', ContentFile(content), save=False)
+        book.save()
+        return book
+
+    def test_same_content_is_stored_once(self):
+        content = '%PDF-1.4\nодин и тот же учебник'.encode()
+        first, second = self.make_copy(content), self.make_copy(content)
+        sha256 = hashlib.sha256(content).hexdigest()
+        self.assertEqual(first.pdf.name, f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.pdf')
+        self.assertEqual(second.pdf.name, first.pdf.name)
+        self.assertEqual(os.listdir(os.path.dirname(self.storage.path(first.pdf.name))), [f'{sha256}.pdf'])
+
+    def test_blob_is_released_with_last_reference(self):
+        first = self.make_copy(b'%PDF-1.4\nshared')
+        second = self.make_copy(b'%PDF-1.4\nshared')
+        name = first.pdf.name
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_replaced_file_is_released(self):
+        book = self.make_copy(b'%PDF-1.4\nfirst edition')
+        old = book.pdf.name
+        with self.captureOnCommitCallbacks(execute=True):
+            book.pdf.save('учебник.pdf', ContentFile(b'%PDF-1.4\nsecond edition'))
+        self.assertNotEqual(book.pdf.name, old)
+        self.assertFalse(self.storage.exists(old))
+        self.assertTrue(self.storage.exists(book.pdf.name))
+
+    def test_dedupe_media(self):
+        # файлы, загруженные до перехода на blobs/, под исходными именами
+        legacy = {'books/2020/a.pdf': b'%PDF-1.4\nA', 'books/2021/a (1).pdf': b'%PDF-1.4\nA',
+                  'books/2021/b.pdf': b'%PDF-1.4\nB'}
+        for name, content in legacy.items():
+            path = self.storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(content)
+        books = {name: self.make_book(title=name) for name in legacy}
+        for name, book in books.items():
+            Book.objects.filter(id=book.id).update(pdf=name)
+
+        call_command('dedupe_media', '--dry-run', stdout=io.StringIO())
+        self.assertTrue(all(self.storage.exists(name) for name in legacy))
+        self.assertEqual(set(Book.objects.filter(id__in=[book.id for book in books.values()])
+                             .values_list('pdf', flat=True)), set(legacy))
+
+        output = io.StringIO()
+        call_command('dedupe_media', stdout=output)
+        self.assertIn('уникальных: 2', output.getvalue())
+        names = {name: Book.objects.get(id=book.id).pdf.name for name, book in books.items()}
+        self.assertEqual(names['books/2020/a.pdf'], names['books/2021/a (1).pdf'])
+        self.assertNotEqual(names['books/2020/a.pdf'], names['books/2021/b.pdf'])
+        for name, blob in names.items():
+            self.assertTrue(blob.startswith('blobs/'))
+            with self.storage.open(blob, 'rb') as file:
+                self.assertEqual(file.read(), legacy[name])
+            self.assertFalse(self.storage.exists(name))
+
+
+
+class DuplicatesTest(CatalogTestCase):
+    TITLES = [
+        'Основы программирования на Python', 'Введение в теорию вероятностей',
+        'Математический анализ. Часть первая', 'Линейная алгебра и аналитическая геометрия',
+        'История Кыргызстана', 'Физика для инженеров', 'Органическая химия',
+        'Теория алгоритмов и структуры данных', 'Экономическая теория', 'Базы данных',
+    ]
+
+    def test_near_duplicates_are_found(self):
+        # каждое название с автором повторяется ещё в 35 сборниках: все триграммы
+        # пары «оригинал — опечатка» частые, и отсечка по частоте их бы потеряла
+        originals = [self.make_book(title=title, author=f'Автор {i}') for i, title in enumerate(self.TITLES)]
+        for i, title in enumerate(self.TITLES[:4]):
+            for issue in range(35):
+                self.make_book(title=f'{title}: сборник упражнений и задач, выпуск {issue}', author=f'Автор {i}')
+        planted = [
+            (originals[0], self.make_book(title='Основы програмирования на Python', author='Автор 0')),
+            (originals[1], self.make_book(title='Введение в теорию вероятностеи', author='Автор 1')),
+            (originals[2], self.make_book(title='Математический анализ, часть первая', author='Автор 2')),
+            (originals[3], self.make_book(title='Линейная алгебра и аналитическая геометрия', author='Автр 3')),
+        ]
+        clusters = near_clusters()
+        for original, copy in planted:
+            self.assertTrue(any(original.id in cluster and copy.id in cluster for cluster in clusters),
+                            (original.title, copy.title))
+        # выпуски сборника склеиваются между собой, но разные книги — нет
+        originals_ids = {book.id for book in originals}
+        for cluster in clusters:
+            self.assertLessEqual(len(originals_ids & set(cluster)), 1)
+
+    def test_exact_duplicates_skip_blank_titles(self):
+        first = self.make_book(title='Базы данных', author='Иванов')
+        copy = self.make_book(title='  базы   ДАННЫХ ', author='иванов')
+        blank = [self.make_book(title='', author='Иванов') for _ in range(2)]
+        clusters = exact_clusters()
+        self.assertIn([first.id, copy.id], clusters)
+        self.assertFalse(any(book.id in cluster for cluster in clusters for book in blank))
+
+    def test_same_file_is_exact_duplicate(self):
+        first = self.make_book(title='Физика', author='Иванов')
+        renamed = self.make_book(title='Физика. Том 1', author='Петров')
+        Book.objects.filter(id=renamed.id).update(pdf=first.pdf.name)
+        self.assertEqual(exact_clusters(), [[first.id, renamed.id]])
+
+    def test_delete_keeps_oldest_copy(self):
+        books = [self.make_book(title='Базы данных', author='Иванов') for _ in range(3)]
+        other = self.make_book(title='Сети', author='Иванов')
+        self.assertEqual(delete_duplicates(exact_clusters()), 2)
+        self.assertEqual(list(Book.objects.order_by('id').values_list('id', flat=True)), [books[0].id, other.id])
+
+    def test_long_union_chain(self):
+        clusters = DisjointSet()
+        for pk in range(1, 5000):
+            clusters.union(pk, pk + 1)
+        self.assertEqual(clusters.clusters(), [list(range(1, 5001))])
+
+
+
+def image_file(width, height, fmt='PNG'):
+    image = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(image, fmt)
+    return ContentFile(image.getvalue())
+
+
+class ThumbnailsTest(CatalogTestCase):
+    def test_render_variants(self):
+        book = self.make_book()
+        book.image1.save('cover.png', image_file(500, 800))
+        self.assertEqual(render_variants(book.image1.path), {'webp': [160, 320], 'jpeg': [160, 320]})
+        with Image.open(variant_name(book.image1.path, 320, 'webp')) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 512)))
+        # меньше самой маленькой ширины — одно превью, без растягивания
+        book.image1.save('small.png', image_file(100, 50))
+        self.assertEqual(render_variants(book.image1.path), {'webp': [160], 'jpeg': [160]})
+        with Image.open(variant_name(book.image1.path, 160, 'jpeg')) as image:
+            self.assertEqual(image.size, (100, 50))
+
+    def test_task_fills_srcset(self):
+        book = self.make_book()
+        book.image1.save('cover.png', image_file(700, 1000))
+        generate_thumbnails('event.Book', book.id)
+        book.refresh_from_db()
+        self.assertEqual(set(book.image1_variants['webp']), {'160', '320', '640'})
+        data = self.client.get(f'/api/v1/books/{book.id}/').data
+        url = f'{settings.LINK}{book.image1.storage.url(variant_name(book.image1.name, 160, "webp"))}'
+        self.assertTrue(data['srcset']['webp'].startswith(f'{url} 160w, '))
+
+        news = News.objects.create(title='Новость', description='Текст')
+        news.image1.save('news.png', image_file(200, 100))
+        generate_thumbnails('event.News', news.id)
+        news.refresh_from_db()
+        self.assertEqual(news.get_srcset()['jpeg'],
+                         f'{news.image1.storage.url(variant_name(news.image1.name, 160, "jpeg"))} 160w')
+
+    def test_create_book_schedules_task(self):
+        self.client.force_authenticate(self.teacher)
+        with mock.patch('event.views.generate_thumbnails.delay') as delay, \
+                mock.patch('event.views.extract_pdf_metadata.delay'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/v1/books/create_book/', {
+                'title': 'Книга', 'author': 'Автор', 'description': 'Описание', 'pages': 10, 'year': 2020,
+                'direction': self.direction.name, 'genre': self.genre.name,
+                'pdf': ContentFile(b'%PDF-1.4\n', name='book.pdf'), 'image1': image_file(10, 10).open(),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        delay.assert_called_once_with('event.Book', response.data['id'])
+
+    def test_command_backfills_and_reports_broken_files(self):
+        covered = self.make_book(title='С обложкой')
+        covered.image1.save('cover.png', image_file(400, 400))
+        broken = self.make_book(title='Битая обложка')
+        broken.image1.save('broken.png', ContentFile(b'not an image'))
+        self.make_book(title='Без обложки')
+
+        stderr = io.StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=io.StringIO(), stderr=stderr)
+        covered.refresh_from_db()
+        broken.refresh_from_db()
+        self.assertEqual(set(covered.image1_variants['jpeg']), {'160', '320'})
+        self.assertEqual(broken.image1_variants, {})
+        self.assertIn(f'Book #{broken.id}', stderr.getvalue())
+
+
+
+@override_settings(STATS_FLUSH_INTERVAL=3600, STATS_FLUSH_SIZE=100)
+class StatsBufferTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buffer = StatsBuffer()
+        # фоновый поток в тестах не нужен: сбрасываем руками
+        self.buffer.start = mock.Mock()
+        self.book = self.make_book()
+        self.student = self.students[0]
+
+    def counters(self):
+        return BookCounters.objects.values_list('views', 'downloads').get(book=self.book)
+
+    def flags(self, user):
+        return ViewsStats.objects.values_list('v_count', 'd_count').get(user=user, book=self.book)
+
+    def test_events_are_buffered_and_merged(self):
+        with self.assertNumQueries(0):
+            self.buffer.record(self.student.id, self.book.id, view=True)
+            self.buffer.record(self.student.id, self.book.id, view=True)
+            self.buffer.record(self.students[1].id, self.book.id, down=True)
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.flags(self.student), (True, False))
+        self.assertEqual(self.flags(self.students[1]), (False, True))
+        self.assertEqual(self.counters(), (1, 1))
+
+        # повторный просмотр не считается, первое скачивание — считается
+        self.buffer.record(self.student.id, self.book.id, view=True, down=True)
+        self.buffer.flush()
+        self.assertEqual(self.flags(self.student), (True, True))
+        self.assertEqual(self.counters(), (1, 2))
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_flush_when_buffer_is_full(self):
+        with self.settings(STATS_FLUSH_SIZE=2):
+            self.buffer.record(self.student.id, self.book.id, view=True)
+            self.assertFalse(ViewsStats.objects.exists())
+            self.buffer.record(self.students[1].id, self.book.id, view=True)
+        self.assertEqual(ViewsStats.objects.count(), 2)
+        self.assertEqual(self.buffer.pending, {})
+
+    def test_flag_set_elsewhere_is_not_counted_twice(self):
+        # другой процесс сбрасывает то же событие посреди нашего сброса
+        other = StatsBuffer()
+        other.start = mock.Mock()
+        for buffer in (self.buffer, other):
+            buffer.record(self.student.id, self.book.id, view=True)
+        bulk_create = ViewsStats.objects.bulk_create
+
+        def interleaved(*args, **kwargs):
+            if other.pending:
+                other.flush()
+            return bulk_create(*args, **kwargs)
+
+        with mock.patch.object(ViewsStats.objects, 'bulk_create', side_effect=interleaved):
+            self.buffer.flush()
+        self.assertEqual(self.counters(), (1, 0))
+
+        ViewsStats.objects.filter(user=self.students[1]).delete()
+        ViewsStats.objects.bulk_create([ViewsStats(user=self.students[1], book=self.book, d_count=True)])
+        self.buffer.record(self.students[1].id, self.book.id, down=True)
+        self.buffer.flush()
+        self.assertEqual(self.counters(), (1, 0))
+
+    def test_database_error_keeps_events(self):
+        self.buffer.record(self.student.id, self.book.id, view=True)
+        with mock.patch('event.counters.write', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('event.counters', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.buffer.start.assert_called()
+        self.assertFalse(ViewsStats.objects.exists())
+
+        # события, пришедшие за время сбоя, сливаются с возвращёнными
+        self.buffer.record(self.student.id, self.book.id, down=True)
+        self.assertEqual(self.buffer.pending, {(self.student.id, self.book.id): {'v_count', 'd_count'}})
+        self.buffer.flush()
+        self.assertEqual(self.flags(self.student), (True, True))
+        self.assertEqual(self.counters(), (1, 1))
+
+    def test_record_does_not_raise(self):
+        with self.settings(STATS_FLUSH_INTERVAL=0), \
+                mock.patch('event.counters.write', side_effect=RuntimeError), \
+                self.assertLogs('event.counters', 'ERROR'):
+            self.buffer.record(self.student.id, self.book.id, view=True)
+
+    def test_add_view_endpoint(self):
+        self.client.force_authenticate(self.student)
+        with self.settings(STATS_FLUSH_INTERVAL=0):
+            self.assertEqual(self.client.get(f'/api/v1/books/{self.book.id}/add_view/').status_code, 202)
+        self.assertEqual(self.flags(self.student), (True, False))
+        self.client.force_authenticate(self.teacher)
+        self.assertEqual(self.client.get(f'/api/v1/books/{self.book.id}/add_view/').status_code, 204)
+
+
+
+class CountersTest(CatalogTestCase):
+    def counters(self, book):
+        return BookCounters.objects.values('views', 'downloads', 'favorites', 'comments').get(book=book)
+
+    def test_signals_keep_counters(self):
+        book = self.make_books(1)[0]
+        self.assertEqual(self.counters(book), {'views': 3, 'downloads': 3, 'favorites': 3, 'comments': 3})
+        Comment.objects.filter(book=book).first().delete()
+        Favorite.objects.filter(book=book).first().delete()
+        self.assertEqual(self.counters(book), {'views': 3, 'downloads': 3, 'favorites': 2, 'comments': 2})
+
+    def test_drifted_counter_does_not_break_delete(self):
+        book = self.make_books(1)[0]
+        BookCounters.objects.filter(book=book).update(comments=0, favorites=0)
+        Comment.objects.filter(book=book).first().delete()
+        self.assertEqual(self.counters(book)['comments'], 0)
+
+        rebuild_counters()
+        self.assertEqual(self.counters(book), {'views': 3, 'downloads': 3, 'favorites': 3, 'comments': 2})
+
+        BookCounters.objects.filter(book=book).update(comments=0, favorites=0, views=0, downloads=0)
+        book.delete()
+        self.assertFalse(BookCounters.objects.filter(book_id=book.id).exists())
+
+    def test_single_view_stats_changes(self):
+        book = self.make_book()
+        stats = ViewsStats.objects.create(user=self.students[0], book=book, v_count=True)
+        stats.d_count = True
+        stats.save()
+        stats.v_count = False
+        stats.save()
+        self.assertEqual(self.counters(book), {'views': 0, 'downloads': 1, 'favorites': 0, 'comments': 0})
+        stats.delete()
+        self.assertEqual(self.counters(book)['downloads'], 0)
+
+    def test_reconcile_command(self):
+        books = self.make_books(2)
+        BookCounters.objects.all().delete()
+        # книга без строки счётчиков тоже получает её
+        call_command('reconcile_counters', stdout=io.StringIO())
+        for book in books:
+            self.assertEqual(self.counters(book), {'views': 3, 'downloads': 3, 'favorites': 3, 'comments': 3})
+        self.assertEqual(rebuild_counters(book_ids=[books[0].id]), 1)
+
+
+
+class AggregatesTest(CatalogTestCase):
+    LOCK = f'{KEY_PREFIX}:aggregate:directions:lock'
+
+    def stats(self, queries, url='/api/v1/stats/'):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return {row['name']: row for row in response.data}
+
+    def test_grouped_in_one_query(self):
+        architecture = BookDirection.objects.create(name='Архитектура')
+        self.make_books(2)
+        self.make_book(direction=architecture)
+        stats = self.stats(1)
+        # в порядке id, как было до кэша
+        self.assertEqual(list(stats), ['ИТ', 'Архитектура'])
+        self.assertEqual(stats['ИТ'], {'id': self.direction.id, 'name': 'ИТ', 'books_count': 2,
+                                       'views': 6, 'downloads': 6, 'favorites': 6})
+        self.assertEqual(stats['Архитектура']['books_count'], 1)
+        self.assertEqual(self.stats(1, '/api/v1/stats/genres/')['Учебник']['books_count'], 3)
+        self.assertEqual(self.client.post('/api/v1/stats/').status_code, 405)
+
+    def test_refreshed_at_most_every_interval(self):
+        self.make_books(1)
+        self.stats(1)
+        self.stats(0)
+        self.make_book()
+        # поколение сменилось, но прошлый результат ещё моложе REFRESH_INTERVAL
+        self.assertEqual(self.stats(0)['ИТ']['books_count'], 1)
+        later = time.time() + REFRESH_INTERVAL + 1
+        with mock.patch('event.aggregates.time.time', return_value=later):
+            # пересчитывает другой процесс — отдаём прошлый результат
+            cache.set(self.LOCK, 'other')
+            self.assertEqual(self.stats(0)['ИТ']['books_count'], 1)
+            cache.delete(self.LOCK)
+            self.assertEqual(self.stats(1)['ИТ']['books_count'], 2)
+        self.assertIsNone(cache.get(self.LOCK))
+
+    def test_foreign_lock_is_kept(self):
+        # первый расчёт идёт без замка и не должен снимать чужой
+        cache.set(self.LOCK, 'other')
+        self.stats(1)
+        self.assertEqual(cache.get(self.LOCK), 'other')
+        release_lock(self.LOCK, 'mine')
+        self.assertEqual(cache.get(self.LOCK), 'other')
+        release_lock(self.LOCK, 'other')
+        self.assertIsNone(cache.get(self.LOCK))
+
+
+def pdf_object(num, body):
+    return b'%d 0 obj\n' % num + body + b'\nendobj\n'
+
+
+def pdf_stream(num, attrs, data):
+    return pdf_object(num, b'<< ' + attrs + b' /Length %d >>\nstream\n' % len(data) + data + b'\nendstream')
+
+
+def xref_table(offsets, trailer, startxref):
+    size = max(offsets) + 1
+    rows = [b'xref\n0 %d\n' % size]
+    for num in range(size):
+        rows.append(b'%010d 00000 n \n' % offsets[num] if num in offsets else b'0000000000 65535 f \n')
+    return b''.join(rows) + b'trailer\n<< /Size %d ' % size + trailer + b' >>\nstartxref\n%d\n%%%%EOF\n' % startxref
+
+
+def build_pdf(objects, trailer, version='1.4'):
+    # objects: {номер: тело объекта}; классическая таблица xref
+    out = b'%%PDF-%s\n' % version.encode()
+    offsets = {}
+    for num, body in sorted(objects.items()):
+        offsets[num] = len(out)
+        out += pdf_object(num, body)
+    return out + xref_table(offsets, trailer, len(out))
+
+
+def build_compressed_pdf(objects, trailer):
+    # PDF 1.5: все объекты в /ObjStm, xref — сжатый поток с PNG-предиктором Up
+    nums = sorted(objects)
+    header, body = [], b''
+    for num in nums:
+        header.append(b'%d %d' % (num, len(body)))
+        body += objects[num] + b'\n'
+    header = b' '.join(header) + b'\n'
+    objstm, xref = max(nums) + 1, max(nums) + 2
+    out = b'%PDF-1.5\n'
+    objstm_offset = len(out)
+    out += pdf_stream(objstm, b'/Type /ObjStm /N %d /First %d /Filter /FlateDecode' % (len(nums), len(header)),
+                      zlib.compress(header + body))
+    xref_offset = len(out)
+    entries = {0: (0, 0, 255)}
+    entries.update({num: (2, objstm, index) for index, num in enumerate(nums)})
+    entries[objstm] = (1, objstm_offset, 0)
+    entries[xref] = (1, xref_offset, 0)
+    data, previous = b'', bytes(6)
+    for num in sorted(entries):
+        kind, field, extra = entries[num]
+        row = bytes([kind]) + field.to_bytes(4, 'big') + bytes([extra])
+        data += b'\x02' + bytes((value - above) % 256 for value, above in zip(row, previous))
+        previous = row
+    index = b' '.join(b'%d 1' % num for num in sorted(entries))
+    out += pdf_stream(xref, b'/Type /XRef /Size %d /Index [%s] /W [1 4 1] /Filter /FlateDecode '
+                            b'/DecodeParms << /Predictor 12 /Columns 6 >> ' % (xref + 1, index) + trailer,
+                      zlib.compress(data))
+    return out + b'startxref\n%d\n%%%%EOF\n' % xref_offset
+
+
+def page_tree(count):
+    # 1 — каталог, 2 — /Pages, со 100-го — страницы
+    kids = b' '.join(b'%d 0 R' % (100 + i) for i in range(count))
+    objects = {1: b'<< /Type /Catalog /Pages 2 0 R >>',
+               2: b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % count}
+    for i in range(count):
+        objects[100 + i] = b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>'
+    return objects
+
+
+def utf16(text):
+    return b'<' + ('\ufeff' + text).encode('utf-16-be').hex().encode() + b'>'
+
+
+class PDFMetadataTest(TestCase):
+    INFO = b'<< /Title ' + utf16('Учебник по Python') + \
+        b' /Author (Ivanov \\(ed.\\)) /CreationDate (D:20190512120000Z) >>'
+
+    def read(self, data):
+        with tempfile.NamedTemporaryFile(suffix='.pdf') as file:
+            file.write(data)
+            file.flush()
+            return read_metadata(file.name)
+
+    def test_classic_xref(self):
+        objects = page_tree(3)
+        objects[10] = self.INFO
+        self.assertEqual(self.read(build_pdf(objects, b'/Root 1 0 R /Info 10 0 R')), {
+            'pages': 3, 'version': '1.4', 'encrypted': False, 'title': 'Учебник по Python',
+            'author': 'Ivanov (ed.)', 'creation_date': 'D:20190512120000Z', 'year': 2019,
+        })
+
+    def test_object_and_xref_streams(self):
+        objects = page_tree(5)
+        objects[10] = self.INFO
+        metadata = self.read(build_compressed_pdf(objects, b'/Root 1 0 R /Info 10 0 R'))
+        self.assertEqual((metadata['pages'], metadata['title'], metadata['version']), (5, 'Учебник по Python', '1.5'))
+
+    def test_incremental_update_wins(self):
+        objects = page_tree(2)
+        objects[10] = self.INFO
+        original = build_pdf(objects, b'/Root 1 0 R /Info 10 0 R')
+        first_xref = int(original.rsplit(b'startxref', 1)[1].split()[0])
+        # дописанная секция: новый /Info под тем же номером и ссылка /Prev на старую
+        offset = len(original)
+        update = pdf_object(10, b'<< /Title (Second edition) >>')
+        position = offset + len(update)
+        update += b'xref\n10 1\n%010d 00000 n \ntrailer\n<< /Size 102 /Root 1 0 R /Info 10 0 R /Prev %d >>\n' \
+            b'startxref\n%d\n%%%%EOF\n' % (offset, first_xref, position)
+        metadata = self.read(original + update)
+        self.assertEqual((metadata['pages'], metadata['title']), (2, 'Second edition'))
+
+    def test_large_object_is_read_in_full(self):
+        objects = page_tree(1)
+        objects[10] = b'<< /Title (' + b'a' * 200000 + b') >>'
+        self.assertEqual(len(self.read(build_pdf(objects, b'/Root 1 0 R /Info 10 0 R'))['title']), 200000)
+
+    def test_encrypted_info_is_not_read(self):
+        objects = page_tree(4)
+        objects[10] = self.INFO
+        objects[11] = b'<< /Filter /Standard /V 5 /R 6 >>'
+        metadata = self.read(build_pdf(objects, b'/Root 1 0 R /Info 10 0 R /Encrypt 11 0 R'))
+        self.assertEqual(metadata, {'pages': 4, 'version': '1.4', 'encrypted': True})
+
+    def test_broken_xref_is_recovered_by_scan(self):
+        data = build_pdf(page_tree(7), b'/Root 1 0 R')
+        data = data[:data.rindex(b'startxref')] + b'startxref\n99999\n%%EOF\n'
+        self.assertEqual(self.read(data), {'pages': 7, 'version': '1.4', 'recovered': True})
+
+    def test_not_a_pdf(self):
+        with self.assertRaises(PDFError):
+            self.read(b'hello world' * 100)
+
+    def test_truncated_file(self):
+        data = build_pdf(page_tree(3), b'/Root 1 0 R')
+        with self.assertRaises(PDFError):
+            self.read(data[:data.index(b'/Type /Pages')])
+
+    def test_has_pdf_header_keeps_position(self):
+        file = io.BytesIO(b'junk\n%PDF-1.7\n')
+        file.seek(2)
+        self.assertTrue(has_pdf_header(file))
+        self.assertEqual(file.tell(), 2)
+        self.assertFalse(has_pdf_header(io.BytesIO(b'GIF89a')))
+
+
+class PDFStatusTest(CatalogTestCase):
+    def test_metadata_fills_pages_but_not_year(self):
+        book = self.make_book(year=None, pages=None)
+        save_pdf_metadata(book, {'pages': 12, 'year': 2019, 'version': '1.4'})
+        book.refresh_from_db()
+        self.assertEqual((book.pages, book.year, book.pdf_status), (12, None, 'ok'))
+        self.assertEqual(book.pdf_metadata['year'], 2019)
+
+    def test_manual_pages_are_kept(self):
+        book = self.make_book(pages=300)
+        save_pdf_metadata(book, {'pages': 12})
+        book.refresh_from_db()
+        self.assertEqual(book.pages, 300)
+
+    def test_status_is_not_public(self):
+        book = self.make_book()
+        self.assertNotIn('pdf_status', self.client.get(f'/api/v1/books/{book.id}/').data)
+        self.assertNotIn('pdf_status', self.client.get('/api/v1/books/').data[0])
+
+    def test_command_marks_pending_books(self):
+        good = self.make_book()
+        broken = self.make_book(title='Битая')
+        storage = Book._meta.get_field('pdf').storage
+        with open(storage.path(good.pdf.name), 'wb') as file:
+            file.write(build_pdf(page_tree(6), b'/Root 1 0 R'))
+        call_command('extract_pdf_metadata', workers=1, stdout=io.StringIO(), stderr=io.StringIO())
+        statuses = dict(Book.objects.values_list('id', 'pdf_status'))
+        self.assertEqual((statuses[good.id], statuses[broken.id]), ('ok', 'corrupt'))
+        self.assertEqual(Book.objects.get(id=good.id).pages, 100)
+
+
+class IngestBooksTest(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.files = {
+            'good.pdf': build_pdf(page_tree(7), b'/Root 1 0 R'),
+            'copy.pdf': build_pdf(page_tree(7), b'/Root 1 0 R'),
+            'broken.pdf': b'%PDF-1.4\nno xref here',
+            'text.pdf': b'not a pdf at all',
+            'other.pdf': build_pdf(page_tree(2), b'/Root 1 0 R'),
+        }
+        for name, content in self.files.items():
+            with open(os.path.join(self.root, name), 'wb') as file:
+                file.write(content)
+        with open(os.path.join(self.root, 'cover.png'), 'wb') as file:
+            file.write(image_file(20, 20).read())
+
+    def manifest(self, rows, name='manifest.csv'):
+        path = os.path.join(self.root, name)
+        if name.endswith('.json'):
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump({'books': rows}, file, ensure_ascii=False)
+            return path
+        columns = ['pdf', 'title', 'author', 'direction', 'genre', 'year', 'pages', 'image', 'author_email']
+        with open(path, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, columns)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def ingest(self, path, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('ingest_books', path, '--workers=1', '--batch-size=2', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def row(self, pdf, title, **fields):
+        return {'pdf': pdf, 'title': title, 'author': 'Автор', 'direction': 'ИТ', **fields}
+
+    def test_ingest_and_resume(self):
+        path = self.manifest([
+            self.row('good.pdf', 'Хорошая', genre='Задачник', year='2015', image='cover.png',
+                     author_email=self.teacher.email),
+            self.row('copy.pdf', 'Та же книга'),
+            self.row('broken.pdf', 'Битая', pages='40'),
+            self.row('text.pdf', 'Не PDF'),
+            self.row('missing.pdf', 'Нет файла'),
+            self.row('other.pdf', 'Чужое направление', direction='Экономика'),
+            self.row('', 'Без файла'),
+        ])
+        stdout, stderr = self.ingest(path, '--dry-run')
+        self.assertIn('К загрузке: 4', stdout)
+        self.assertFalse(Book.objects.exists())
+        for message in ['нет файла', 'неизвестное направление Экономика', 'Строка 7: нет pdf']:
+            self.assertIn(message, stderr)
+
+        stdout, stderr = self.ingest(path)
+        self.assertIn('добавлено 2, дубликатов 1, ошибок 1', stdout)
+        self.assertIn('text.pdf', stderr)
+        good = Book.objects.get(title='Хорошая')
+        self.assertEqual((good.pages, good.year, good.pdf_status), (7, 2015, 'ok'))
+        self.assertEqual((good.genre.name, good.author_account_id), ('Задачник', self.teacher.id))
+        self.assertTrue(good.pdf.name.startswith('blobs/') and good.image1.name.startswith('blobs/'))
+        with good.pdf.open('rb') as file:
+            self.assertEqual(file.read(), self.files['good.pdf'])
+        self.assertTrue(BookCounters.objects.filter(book=good).exists())
+        broken = Book.objects.get(title='Битая')
+        self.assertEqual((broken.pages, broken.pdf_status), (40, 'corrupt'))
+
+        # обработанные строки в журнале, повторный запуск берёт только остальные;
+        # файлы с ошибкой не отмечаются — их можно исправить и загрузить заново
+        with open(f'{path}.done', encoding='utf-8') as file:
+            self.assertEqual(sorted(file.read().split()), ['broken.pdf', 'copy.pdf', 'good.pdf'])
+        BookDirection.objects.create(name='Экономика')
+        stdout, _ = self.ingest(path)
+        self.assertIn('К загрузке: 2, уже загружено ранее: 3', stdout)
+        self.assertIn('добавлено 1, дубликатов 0, ошибок 1', stdout)
+        self.assertEqual(Book.objects.count(), 3)
+
+    def test_json_manifest_refreshes_indexes(self):
+        self.assertEqual(self.client.get('/api/v1/books/random/').data, [])
+        path = self.manifest([self.row('other.pdf', 'Органическая химия')], 'manifest.json')
+        self.ingest(path)
+        book = Book.objects.get()
+        self.assertEqual([row['id'] for row in self.client.get('/api/v1/books/random/').data], [book.id])
+        self.assertEqual([row['id'] for row in self.client.get('/api/v1/books/autocomplete/?q=орган').data],
+                         [book.id])
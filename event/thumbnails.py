@@ -0,0 +1,53 @@
+import os
+
+from PIL import Image, ImageOps
+
+# ширины превью обложек; больше оригинала не растягиваем
+SIZES = (160, 320, 640)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def variant_name(name, width, fmt):
+    # рядом с оригиналом: blobs/ab/cd/<sha256>_320.webp
+    return f'{os.path.splitext(name)[0]}_{width}.{fmt}'
+
+
+def render_variants(path):
+    """
+    Нарезает превью для файла path и возвращает {fmt: [width, ...]}.
+
+    Не трогает ORM, поэтому годится и для Celery, и для ProcessPoolExecutor.
+    """
+    rendered = {fmt: [] for fmt, _, _ in FORMATS}
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        widths = [width for width in SIZES if width < image.width] or [min(SIZES)]
+        for width in widths:
+            resized = image.copy()
+            resized.thumbnail((width, width * 10), Image.LANCZOS)
+            for fmt, pil_format, options in FORMATS:
+                target = variant_name(path, width, fmt)
+                if not os.path.exists(target):
+                    tmp = f'{target}.part'
+                    resized.save(tmp, pil_format, **options)
+                    os.replace(tmp, target)
+                rendered[fmt].append(width)
+    return rendered
+
+
+def variants_for(name, rendered):
+    return {fmt: {str(width): variant_name(name, width, fmt) for width in widths}
+            for fmt, widths in rendered.items()}
+
+
+def srcset(variants, url):
+    # {'webp': 'url 160w, url 320w', 'jpeg': ...} — готовое значение для <source srcset>
+    return {
+        fmt: ', '.join(f'{url(name)} {width}w' for width, name in sorted(sizes.items(), key=lambda item: int(item[0])))
+        for fmt, sizes in (variants or {}).items()
+    }
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import shutil
+
+from django.conf import settings
+
+from .models import Book, UploadChunk, UploadSession
+from .pdfmeta import has_pdf_header
+from .storage import release
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def open_session(user, filename, size, chunk_size=None):
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    if size <= 0 or size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError('Недопустимый размер файла')
+    if chunk_size <= 0 or chunk_size > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError('Недопустимый размер куска')
+    session = UploadSession.objects.create(
+        user=user, filename=os.path.basename(filename), size=size, chunk_size=chunk_size
+    )
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    # файл сразу нужного размера — куски пишутся по своим смещениям в любом порядке
+    with open(session.temp_path, 'wb') as file:
+        file.truncate(size)
+    return session
+
+
+def write_chunk(session, index, stream, checksum=None):
+    if session.book_id:
+        raise UploadError('Загрузка уже завершена', status=409)
+    if index < 0 or index >= session.chunk_count:
+        raise UploadError('Неверный номер куска')
+    expected = session.chunk_length(index)
+    digest = hashlib.sha256()
+    received = 0
+    # кусок перезаписывается на месте: пока он не проверен, он считается
+    # недополученным, иначе неудачный повтор испортит уже принятые байты
+    UploadChunk.objects.filter(session=session, index=index).delete()
+    # читаем тело запроса потоком, в память попадает не больше READ_SIZE
+    with open(session.temp_path, 'r+b') as file:
+        file.seek(index * session.chunk_size)
+        while received <= expected:
+            data = stream.read(min(READ_SIZE, expected + 1 - received))
+            if not data:
+                break
+            received += len(data)
+            if received > expected:
+                break
+            digest.update(data)
+            file.write(data)
+    if received != expected:
+        raise UploadError(f'Ожидалось {expected} байт, получено {received}')
+    sha256 = digest.hexdigest()
+    if checksum and checksum.lower() != sha256:
+        raise UploadError('Контрольная сумма не совпадает')
+    UploadChunk.objects.update_or_create(session=session, index=index, defaults={'sha256': sha256})
+    return sha256
+
+
+def missing_chunks(session):
+    received = set(session.chunks.values_list('index', flat=True))
+    return [index for index in range(session.chunk_count) if index not in received]
+
+
+def finalize(session):
+    # временный файл забирает хранилище через rename, без копирования;
+    # UPLOAD_TEMP_DIR лежит внутри MEDIA_ROOT, т.е. на той же файловой системе
+    if missing_chunks(session):
+        raise UploadError('Загружены не все куски', status=409)
+    with open(session.temp_path, 'rb') as file:
+        if not has_pdf_header(file):
+            raise UploadError('Файл не является PDF')
+    return Book._meta.get_field('pdf').storage.adopt(session.temp_path, session.filename)
+
+
+def restore(session, name):
+    # книга не сохранилась: возвращаем временный файл, чтобы complete можно было
+    # повторить. Копией, а не переносом — этот же blob может быть у другой книги
+    storage = Book._meta.get_field('pdf').storage
+    shutil.copyfile(storage.path(name), session.temp_path)
+    release(name)
+
+
+def discard(session):
+    try:
+        os.remove(session.temp_path)
+    except FileNotFoundError:
+        pass
+    session.delete()
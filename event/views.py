@@ -1,17 +1,32 @@
-from random import sample
+import os
+from urllib.parse import urlencode
 
 from rest_framework.generics import ListAPIView
 from rest_framework.viewsets import GenericViewSet
 from . import serializers
-from .paginator import EventPagination
+from .pdfmeta import has_pdf_header
+from .paginator import EventPagination, KeysetPagination, paginated_response
+from .streaming import streaming_json_response
+from .aggregates import direction_stats, genre_stats
+from .cache import cached_response, get_stats
+from .sampler import sampler
+from .search import search_books
+from .autocomplete import prefix_index
+from .delivery import serve_file
+from .counters import stats_buffer
+from .uploads import UploadError, open_session, write_chunk, missing_chunks, finalize, restore, discard
 from django_filters.rest_framework import DjangoFilterBackend
 from .filters import TenderFilter
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
+from rest_framework.views import APIView
 from .permissions import IsAuthor
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from rest_framework.response import Response
-from .models import Book, Favorite, Comment, BookDirection, Genre, ViewsStats, News
+from .tasks import extract_pdf_metadata, generate_thumbnails
+from .models import Book, Favorite, Comment, BookDirection, Genre, ViewsStats, News, UploadSession
 from rest_framework import status, mixins, viewsets
 from drf_yasg.utils import swagger_auto_schema
 
@@ -27,20 +42,40 @@ class BookViewSet(mixins.RetrieveModelMixin,
     queryset = Book.objects.all()
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve', 'random']:
+        if self.action in ['list', 'retrieve', 'random', 'search']:
             return serializers.BookListSerializer
         return serializers.BookSerializer
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve', 'random']:
+        if self.action in ['list', 'retrieve', 'random', 'search', 'autocomplete', 'download',
+                           'viewers', 'comments']:
             return [AllowAny()]
         if self.action in ['update_book', 'delete_book']:
             return [IsAuthor()]
         else:
             return [IsAuthenticated()]
 
+    def get_requested_fields(self):
+        if self.request.query_params.get('view') == 'card':
+            return serializers.BookListSerializer.CARD_FIELDS
+        fields = self.request.query_params.get('fields')
+        if fields:
+            return [name.strip() for name in fields.split(',') if name.strip()]
+        return None
+
+    def get_serializer(self, *args, **kwargs):
+        if self.action == 'search':
+            kwargs.setdefault('fields', self.get_requested_fields() or serializers.BookListSerializer.CARD_FIELDS)
+        elif self.action in ['list', 'retrieve', 'random']:
+            kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
         queryset = Book.objects.all()
+        if self.action == 'search':
+            queryset = queryset.for_listing(self.get_requested_fields() or serializers.BookListSerializer.CARD_FIELDS)
+        elif self.action in ['list', 'retrieve', 'random']:
+            queryset = queryset.for_listing(self.get_requested_fields())
         # card_type = self.request.query_params.get('genre')
         # filters = Q()
         # queryset = queryset.select_related('author')
@@ -51,49 +86,183 @@ class BookViewSet(mixins.RetrieveModelMixin,
         return queryset
 
     @swagger_auto_schema()
+    @cached_response('books')
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        # старые клиенты без ?cursor/?limit получают весь список как раньше
+        if KeysetPagination.is_requested(request):
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            serializer = self.get_serializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        # ?stream=1 — тот же массив, но отдаётся кусками без сборки в памяти
+        if request.query_params.get('stream') in ('1', 'true'):
+            return streaming_json_response(
+                queryset.order_by('id'), lambda obj: self.get_serializer(obj).data
+            )
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @cached_response('books', per_object=True)
     def retrieve(self, request, *args, **kwargs):
         try:
-            obj = Book.objects.get(id=kwargs.get('pk'))
-            return Response(serializers.BookListSerializer(obj).data)
+            obj = self.get_queryset().get(id=kwargs.get('pk'))
+            # без request в контексте, как раньше: image1 остаётся относительным путём
+            return Response(serializers.BookListSerializer(obj, fields=self.get_requested_fields()).data)
         except Book.DoesNotExist:
             return Response('Not Found', status=404)
 
     @action(detail=False, methods=['GET'])
     def random(self, request):
-        queryset = Book.objects.all().order_by('?')  # Случайная сортировка
-        random_books = sample(list(queryset), min(6, len(queryset)))  # 8 или максимально доступное количество книг
+        # id берутся из закэшированного пула, из БД читаются только выбранные книги
+        direction = request.query_params.get('direction')
+        genre = request.query_params.get('genre')
+        try:
+            direction = int(direction) if direction else None
+            genre = int(genre) if genre else None
+        except ValueError:
+            return Response({'error': 'direction и genre должны быть id'}, status=400)
+        ids = sampler.sample(6, direction=direction, genre=genre)
+        books = self.get_queryset().in_bulk(ids)
+        random_books = [books[pk] for pk in ids if pk in books]
         serializer = self.get_serializer(random_books, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['GET'])
+    def search(self, request):
+        # ?q=...&page=...&page_size=... — FTS5 + bm25, без COUNT(*)
+        query = request.query_params.get('q', '').strip()
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', EventPagination.page_size)), 1),
+                            EventPagination.max_page_size)
+        except ValueError:
+            return Response({'error': 'page и page_size должны быть числами'}, status=400)
+
+        hits = search_books(query, page_size + 1, (page - 1) * page_size)
+        has_next = len(hits) > page_size
+        hits = hits[:page_size]
+        books = self.get_queryset().in_bulk([hit[0] for hit in hits])
+
+        results = []
+        for pk, rank, title, description in hits:
+            if pk not in books:
+                continue
+            rep = self.get_serializer(books[pk]).data
+            rep['rank'] = rank
+            rep['highlight'] = {'title': title, 'description': description}
+            results.append(rep)
+
+        next_url = None
+        if has_next:
+            next_url = request.build_absolute_uri(
+                f"{request.path}?{urlencode({**request.query_params.dict(), 'page': page + 1})}"
+            )
+        return Response({'next': next_url, 'results': results})
+
+    @action(detail=False, methods=['GET'])
+    def autocomplete(self, request):
+        # подсказки из индекса в памяти воркера, без запросов к БД
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'limit должен быть числом'}, status=400)
+        return Response(prefix_index.suggest(request.query_params.get('q', ''), limit))
+
+    def get_book_fields(self, request):
+        genre = request.data.get('genre')
+        Genre.objects.get_or_create(name=genre)
+        return dict(
+            author=request.data.get('author'), title=request.data.get('title'),
+            description=request.data.get('description'),
+            direction=get_object_or_404(BookDirection, name=request.data.get('direction')),
+            pages=request.data.get('pages'), year=request.data.get('year'),
+            image1=request.data.get('image1'), author_account_id=request.user.id,
+            genre=get_object_or_404(Genre, name=genre)
+        )
+
     @action(detail=False, methods=['post'])
     @swagger_auto_schema(request_body=serializers.BookSerializer())
     def create_book(self, request):
         if not request.user.is_authenticated:
             return Response(status=401)
 
-        author = request.data.get('author')
-        title = request.data.get('title')
-        description = request.data.get('description')
-        pages = request.data.get('pages')
-        year = request.data.get('year')
         pdf = request.data.get('pdf')
-        image1 = request.data.get('image1')
-        genre = request.data.get('genre')
-        Genre.objects.get_or_create(name=genre)
-        author_id = request.user.id
-        direction = get_object_or_404(BookDirection, name=request.data.get('direction'))
+        if not pdf or not has_pdf_header(pdf):
+            return Response({'error': 'Файл не является PDF'}, status=400)
 
-        book = Book.objects.create(
-            author=author, title=title, description=description,
-            direction=direction, pages=pages,
-            year=year, pdf=pdf, image1=image1, author_account_id=author_id,
-            genre=get_object_or_404(Genre, name=genre)
-        )
+        book = Book.objects.create(pdf=pdf, **self.get_book_fields(request))
+        transaction.on_commit(lambda: extract_pdf_metadata.delay(book.id))
+        if book.image1:
+            transaction.on_commit(lambda: generate_thumbnails.delay('event.Book', book.id))
+
+        return Response(serializers.BookListSerializer(book).data, status=201)
+
+    # Докачиваемая загрузка PDF:
+    #   POST   uploads/                     filename, size[, chunk_size] -> id
+    #   PUT    uploads/<id>/<index>/        тело — байты куска, X-Chunk-SHA256 по желанию
+    #   GET    uploads/<id>/                какие куски ещё не получены
+    #   POST   uploads/<id>/complete/       поля как у create_book, без pdf
+    #   DELETE uploads/<id>/                отменить загрузку
+    @action(detail=False, methods=['POST'], url_path='uploads')
+    def upload_open(self, request):
+        try:
+            size = int(request.data.get('size', 0))
+            chunk_size = int(request.data.get('chunk_size') or 0) or None
+            session = open_session(request.user, request.data.get('filename') or 'book.pdf', size, chunk_size)
+        except ValueError:
+            return Response({'error': 'size и chunk_size должны быть числами'}, status=400)
+        except UploadError as error:
+            return Response({'error': str(error)}, status=error.status)
+        return Response({'id': session.id, 'chunk_size': session.chunk_size,
+                         'chunk_count': session.chunk_count}, status=201)
+
+    @action(detail=False, methods=['GET', 'DELETE'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)')
+    def upload_status(self, request, upload_id):
+        session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+        if request.method == 'DELETE':
+            discard(session)
+            return Response(status=204)
+        return Response({'id': session.id, 'size': session.size, 'chunk_size': session.chunk_size,
+                         'chunk_count': session.chunk_count, 'missing': missing_chunks(session),
+                         'book': session.book_id})
+
+    @action(detail=False, methods=['PUT'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/(?P<index>\d+)')
+    def upload_chunk(self, request, upload_id, index):
+        session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+        try:
+            sha256 = write_chunk(session, int(index), request.stream, request.headers.get('X-Chunk-SHA256'))
+        except UploadError as error:
+            return Response({'error': str(error)}, status=error.status)
+        return Response({'index': int(index), 'sha256': sha256})
+
+    @action(detail=False, methods=['POST'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/complete')
+    def upload_complete(self, request, upload_id):
+        session = get_object_or_404(UploadSession, id=upload_id, user=request.user)
+        if session.book_id:
+            return Response({'error': 'Загрузка уже завершена', 'book': session.book_id}, status=409)
+        fields = self.get_book_fields(request)
+        try:
+            pdf = finalize(session)
+        except UploadError as error:
+            return Response({'error': str(error)}, status=error.status)
+        except FileNotFoundError:
+            return Response({'error': 'Загрузка уже завершена'}, status=409)
+
+        # книга и отметка о завершении — вместе; если не сохранилось,
+        # файл возвращается на место и complete можно повторить
+        try:
+            with transaction.atomic():
+                book = Book.objects.create(pdf=pdf, **fields)
+                transaction.on_commit(lambda: extract_pdf_metadata.delay(book.id))
+                if book.image1:
+                    transaction.on_commit(lambda: generate_thumbnails.delay('event.Book', book.id))
+                session.book = book
+                session.save()
+                session.chunks.all().delete()
+        except Exception:
+            restore(session, pdf)
+            raise
 
         return Response(serializers.BookListSerializer(book).data, status=201)
 
@@ -132,21 +301,27 @@ class BookViewSet(mixins.RetrieveModelMixin,
 
         return Response('Комментарий добавлен', status=201)
 
+    # Постранично (?cursor=&limit=) то, что раньше целиком встраивалось в профиль преподавателя
+    @action(detail=True, methods=['GET'])
+    def viewers(self, request, pk):
+        queryset = ViewsStats.objects.filter(book_id=pk).select_related('user__group')
+        return paginated_response(request, self, queryset, serializers.ViewsStatsSerializer)
+
+    @action(detail=True, methods=['GET'])
+    def comments(self, request, pk):
+        queryset = Comment.objects.filter(book_id=pk).select_related('user')
+        return paginated_response(request, self, queryset, serializers.CommentSerializer)
+
     @action(detail=True, methods=['GET'])
     def add_view(self, request, pk):
         if not request.user.is_authenticated:
             return Response(status=401)
         if request.user.user_type == 'teacher':
             return Response(status=204)
-        book = get_object_or_404(Book, id=pk)
-        if ViewsStats.objects.filter(user=request.user, book=book).exists():
-            stats = ViewsStats.objects.get(user=request.user, book=book)
-            stats.v_count = True
-            stats.save()
-            return Response(status=204)
-        else:
-            ViewsStats.objects.create(user=request.user, book=book, v_count=True)
-        return Response('OK', status=201)
+        if not Book.objects.filter(id=pk).exists():
+            return Response(status=404)
+        stats_buffer.record(request.user.id, int(pk), view=True)
+        return Response('OK', status=202)
 
     @action(detail=True, methods=['GET'])
     def add_down(self, request, pk):
@@ -154,26 +329,80 @@ class BookViewSet(mixins.RetrieveModelMixin,
             return Response(status=401)
         if request.user.user_type == 'teacher':
             return Response(status=204)
-        book = get_object_or_404(Book, id=pk)
-        if ViewsStats.objects.filter(user=request.user, book=book).exists():
-            stats = ViewsStats.objects.get(user=request.user, book=book)
-            stats.d_count = True
-            stats.save()
-            return Response(status=204)
-        else:
-            ViewsStats.objects.create(user=request.user, book=book, d_count=True)
-        return Response('OK', status=201)
-
+        if not Book.objects.filter(id=pk).exists():
+            return Response(status=404)
+        stats_buffer.record(request.user.id, int(pk), down=True)
+        return Response('OK', status=202)
 
-class DirectionStatsViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['GET'])
+    def download(self, request, pk):
+        book = get_object_or_404(Book.objects.only('id', 'pdf', 'title'), id=pk)
+        if not book.pdf or not book.pdf.storage.exists(book.pdf.name):
+            return Response('PDF Not Found', status=404)
+        # файлы лежат под именами-хэшами, пользователю отдаём по названию книги
+        filename = f'{book.title}{os.path.splitext(book.pdf.name)[1]}'
+        response = serve_file(request, book.pdf, filename)
+        # докачка диапазонами (PDF.js) — одно скачивание, считаем только первый запрос
+        first_chunk = response.status_code == 200 or \
+            response.get('Content-Range', '').startswith('bytes 0-')
+        if first_chunk and request.user.is_authenticated and request.user.user_type != 'teacher':
+            stats_buffer.record(request.user.id, book.id, down=True)
+        return response
+
+    # Пачка событий от читалки: {"events": [{"book": 1, "type": "view" | "down"}, ...]}
+    @action(detail=False, methods=['POST'], url_path='stats/batch', parser_classes=[JSONParser])
+    def stats_batch(self, request):
+        if not request.user.is_authenticated:
+            return Response(status=401)
+        events = request.data.get('events')
+        if not isinstance(events, list) or len(events) > STATS_BATCH_LIMIT:
+            return Response({'error': f'events — список не длиннее {STATS_BATCH_LIMIT}'}, status=400)
+        if request.user.user_type == 'teacher':
+            return Response(status=204)
+        parsed = []
+        for event in events:
+            try:
+                parsed.append((int(event['book']), event['type']))
+            except (KeyError, TypeError, ValueError):
+                return Response({'error': 'Неверное событие', 'event': event}, status=400)
+            if event['type'] not in ('view', 'down'):
+                return Response({'error': 'type — view или down', 'event': event}, status=400)
+        known = set(Book.objects.filter(id__in={book_id for book_id, _ in parsed}).values_list('id', flat=True))
+        for book_id, kind in parsed:
+            if book_id in known:
+                stats_buffer.record(request.user.id, book_id, view=kind == 'view', down=kind == 'down')
+        unknown = sorted({book_id for book_id, _ in parsed} - known)
+        return Response({'accepted': sum(book_id in known for book_id, _ in parsed), 'unknown': unknown},
+                        status=202)
+
+
+STATS_BATCH_LIMIT = 500
+
+
+class DirectionStatsViewSet(GenericViewSet):
+    # только чтение; данные — из кэша event/aggregates.py
     queryset = BookDirection.objects.all()
     serializer_class = DirectionStatsSerializer
+    pagination_class = None
+
+    def list(self, request, *args, **kwargs):
+        return Response(direction_stats())
+
+    def genres(self, request, *args, **kwargs):
+        return Response(genre_stats())
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
 
 
 class NewsViewSet(mixins.RetrieveModelMixin,
                   mixins.ListModelMixin,
                   GenericViewSet):
-    queryset = Book.objects.all()
+    queryset = News.objects.all()
 
     def get_serializer_class(self):
         return serializers.NewsSerializer
@@ -189,6 +418,7 @@ class NewsViewSet(mixins.RetrieveModelMixin,
         return queryset
 
     @swagger_auto_schema()
+    @cached_response('news')
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         serializer = self.get_serializer(queryset, many=True)
@@ -197,7 +427,7 @@ class NewsViewSet(mixins.RetrieveModelMixin,
     def retrieve(self, request, *args, **kwargs):
         try:
             obj = News.objects.get(id=kwargs.get('pk'))
-            return Response(serializers.BookListSerializer(obj).data)
+            return Response(serializers.NewsSerializer(obj).data)
         except News.DoesNotExist:
             return Response('Not Found', status=404)
 
@@ -215,5 +445,7 @@ class NewsViewSet(mixins.RetrieveModelMixin,
             title=title, description=description,
             image1=image1, author_account_id=author_id,
         )
+        if book.image1:
+            transaction.on_commit(lambda: generate_thumbnails.delay('event.News', book.id))
 
-        return Response(serializers.BookListSerializer(book).data, status=201)
+        return Response(serializers.NewsSerializer(book).data, status=201)